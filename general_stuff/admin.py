@@ -1,58 +1,149 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth.models import User
+from django.db.models import Q
+from . import comments
 from . import models
+from .pagination import EstimatedCountPaginator
+from .search import matching_posts
+
+# The changelists are read over tables with millions of rows: counts are
+# estimated or bounded, foreign keys are joined once per page and picked
+# with autocomplete widgets, dates are browsed with date_hierarchy and the
+# search only runs lookups an index answers (see post_search below).
+
+
+def users_named(term):
+    return User.objects.filter(username=term).values('pk')
+
+
+def post_search(term):
+    """
+    Posts found by `term`: the id, a slug prefix, the author's exact
+    username and, on PostgreSQL, the full-text index. Never a LIKE over
+    the table.
+    """
+    condition = Q(slug__gte=term, slug__lt=f'{term}\uffff') | Q(author__in=users_named(term))
+    if term.isdigit():
+        condition |= Q(pk=int(term))
+    matches = matching_posts(term)
+    if matches is not None:
+        condition |= Q(pk__in=matches)
+    return condition
+
+
+class ScalableChangeList(ChangeList):
+    """
+    Leaves the admin's list_defer columns out of the page and keeps the
+    list without its date_hierarchy range as `undated_queryset`: given a
+    month inside the year being shown, SQLite walks the index over the
+    whole year.
+    """
+    def get_queryset(self, request, exclude_parameters=None):
+        if self.date_hierarchy and exclude_parameters is None:
+            params = self.filter_params
+            self.filter_params = {
+                name: value for name, value in params.items() if not name.startswith(f'{self.date_hierarchy}__')
+            }
+            try:
+                self.undated_queryset = super().get_queryset(request)
+            finally:
+                self.filter_params = params
+        return super().get_queryset(request, exclude_parameters).defer(*self.model_admin.list_defer)
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # the unfiltered total is one more COUNT(*) per page
+    show_full_result_count = False
+    # columns the list doesn't show and that are too big to read 100 at a time
+    list_defer = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ScalableChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return queryset.filter(self.search_condition(search_term)), False
 
 
-# Register your models here.
 @admin.register(models.UserInfo)
-class UserInfoAdmin(admin.ModelAdmin):
+class UserInfoAdmin(ScalableAdmin):
     list_display = ('user', 'phone_number', 'bio', 'status', 'dream_team')
-    list_display_links = [i for i in list_display]
-    list_filter = list_display_links
-    search_fields = (
-        'phone_number', 'bio', 'status',
-        'user__username', 'user__first_name', 'user__last_name',
-        'user__email'
-        )
+    # a link per cell is a reverse() and a resolve() each, 100 rows at a time
+    list_display_links = ('user',)
+    list_select_related = ('user',)
+    list_filter = ('dream_team',)
+    autocomplete_fields = ('user',)
+    ordering = ('-pk',)
+    search_fields = ('user__username',)
+    search_help_text = "Точное имя пользователя"
+
+    def search_condition(self, term):
+        return Q(user__in=users_named(term))
 
 
 @admin.register(models.Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdmin):
     list_display = (
         'id', 'title',
         'author',
         'created_at', 'updated_at',
         'is_published'
     )
-    list_display_links = [i for i in list_display]
-    list_filter = list_display_links
-    search_fields = (
-        'title', 'slug',
-        'author__username', 'author__first_name', 'author__last_name'
-    )
+    list_display_links = ('id', 'title')
+    list_select_related = ('author',)
+    list_defer = ('text', 'text_html')
+    list_filter = ('is_published',)
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ('author',)
+    # what autocomplete needs to be enabled, the search itself is post_search
+    search_fields = ('slug',)
+    search_help_text = "Номер поста, начало ссылки, точное имя автора или слова из заголовка и текста"
     prepopulated_fields = {
         'slug': ('title', )
     }
 
+    def search_condition(self, term):
+        return post_search(term)
+
 
 @admin.register(models.Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = (
-        'id', 'author', 'post' 
-    )
-    list_display_links = [i for i in list_display]
-    list_filter = list_display_links
-    search_fields = (
-        'post__title', 'post__text',
-        'text',
-        'author__username', 'author__first_name', 'author__last_name'
+        'id', 'author', 'post'
     )
+    list_display_links = ('id',)
+    list_select_related = ('author', 'post')
+    # the post is only shown by its title
+    list_defer = ('post__text', 'post__text_html')
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ('post', 'author')
+    ordering = ('-pk',)
+    search_fields = ('post__slug',)
+    search_help_text = "Точное имя автора комментария или то же, что ищет список постов"
+
+    def search_condition(self, term):
+        return Q(author__in=users_named(term)) | Q(post__in=models.Post.objects.filter(post_search(term)).values('pk'))
+
+    # keep Post.comment_count in step with admin edits
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        comments.recount_comments({obj.post_id, form.initial.get('post', obj.post_id)})
+
+    def delete_model(self, request, obj):
+        comments.delete_comments(models.Comment.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        comments.delete_comments(queryset)
 
 
 @admin.register(models.Tagline)
 class TaglineAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'title', 'text' 
+        'id', 'title', 'text'
     )
     list_display_links = [i for i in list_display]
-    list_filter = list_display_links
-    search_fields = list_display_links
+    search_fields = ('title', 'text')
@@ -0,0 +1,217 @@
+import json
+from functools import wraps
+from operator import itemgetter
+from urllib.parse import quote
+
+from django.contrib.auth.models import User
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+from . import models
+from .caching import anonymous_page_cache, page_version
+from .conditional import conditional_page, make_etag, newest_post
+from .context_processors import get_sidebar
+from .pagination import InvalidCursor, KeysetPaginator
+from .templatetags.image_tags import variant_url
+
+# Read-only JSON for the apps and partners: published posts, their authors
+# and the tagline. ?fields= picks what goes out and rows are read with
+# .values() on just the columns behind those fields, then serialized by
+# hand, no model instances are built on the way.
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def image_url(field, column, manifest_column, width):
+    def serialize(row):
+        if not row[column]:
+            return None
+        return variant_url(FieldFile(None, field, row[column]), row[manifest_column], width)
+    return serialize
+
+
+def isoformat(column):
+    return lambda row: row[column].isoformat()
+
+
+# field -> (columns it is read from, row -> JSON value)
+POST_FIELDS = {
+    'id': (('id',), itemgetter('id')),
+    'slug': (('slug',), itemgetter('slug')),
+    'title': (('title',), itemgetter('title')),
+    'url': (('slug',), lambda row: reverse('post-detail', kwargs={'slug': row['slug']})),
+    'author': (('author__username',), itemgetter('author__username')),
+    'created_at': (('created_at',), isoformat('created_at')),
+    'updated_at': (('updated_at',), isoformat('updated_at')),
+    'excerpt': (('excerpt',), itemgetter('excerpt')),
+    'html': (('text_html',), itemgetter('text_html')),
+    'text': (('text',), itemgetter('text')),
+    'image': (
+        ('image', 'image_variants'),
+        image_url(models.Post._meta.get_field('image'), 'image', 'image_variants', 960),
+    ),
+    'comment_count': (('comment_count',), itemgetter('comment_count')),
+}
+# lists leave the bodies in the database unless asked for them
+POST_LIST_FIELDS = ('id', 'slug', 'title', 'url', 'author', 'created_at', 'excerpt', 'image')
+# the whole post, which like the post page is for members only
+POST_BODY_FIELDS = ('html', 'text')
+POST_DETAIL_FIELDS = tuple(field for field in POST_FIELDS if field != 'text')
+
+AUTHOR_FIELDS = {
+    'username': (('username',), itemgetter('username')),
+    'first_name': (('first_name',), itemgetter('first_name')),
+    'last_name': (('last_name',), itemgetter('last_name')),
+    'status': (('userinfo__status',), itemgetter('userinfo__status')),
+    'bio': (('userinfo__bio',), itemgetter('userinfo__bio')),
+    'avatar': (
+        ('userinfo__avatar', 'userinfo__avatar_variants'),
+        image_url(models.UserInfo._meta.get_field('avatar'), 'userinfo__avatar', 'userinfo__avatar_variants', 320),
+    ),
+    'url': (('username',), lambda row: reverse('user-profile', kwargs={'username': row['username']})),
+    'posts': (('username',), lambda row: f"{reverse('api-posts')}?author={quote(row['username'])}"),
+    # a query of its own, only run when asked for
+    'published': (
+        ('id',), lambda row: models.Post.objects.filter(author_id=row['id'], is_published=True).count()
+    ),
+}
+
+
+def requested_fields(request, available, default):
+    fields = [field.strip() for field in request.GET.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(400, f"Неизвестные поля: {', '.join(unknown)}")
+    return fields or list(default)
+
+
+def columns(available, fields, *extra):
+    return list(dict.fromkeys([column for field in fields for column in available[field][0]] + list(extra)))
+
+
+def serialize(rows, available, fields):
+    getters = [(field, available[field][1]) for field in fields]
+    return [{field: get(row) for field, get in getters} for row in rows]
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(400, "limit должен быть числом")
+    if not 1 <= size <= API_MAX_PAGE_SIZE:
+        raise ApiError(400, f"limit должен быть от 1 до {API_MAX_PAGE_SIZE}")
+    return size
+
+
+def page_url(request, direction, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query[direction] = cursor
+    return f'{request.path}?{query.urlencode(safe=",")}'
+
+
+def require_login(request):
+    # the same as the HTML pages: post pages and profiles are for members
+    if not request.user.is_authenticated:
+        raise ApiError(401, "Нужно войти в аккаунт")
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        json.dumps(data, ensure_ascii=False, separators=(',', ':')),
+        content_type='application/json',
+        status=status,
+    )
+
+
+def api_etag(request, **kwargs):
+    # post edits move the newest updated_at, read from the database;
+    # deletes, profiles and the tagline bump the shared page version
+    newest = newest_post(request)
+    return make_etag(
+        page_version(), newest and newest.isoformat(), request.user.is_authenticated, request.build_absolute_uri(),
+    )
+
+
+def no_last_modified(request, **kwargs):
+    # a profile edit doesn't move any date, the ETag covers it
+    return None
+
+
+def api_view(view):
+    """
+    GET/HEAD only, ETag revalidation, the anonymous page cache, and
+    ApiError turned into a JSON error body.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response({'error': error.message}, status=error.status)
+
+    return require_safe(conditional_page(api_etag, no_last_modified)(anonymous_page_cache(wrapper)))
+
+
+@api_view
+def post_list(request):
+    fields = requested_fields(request, POST_FIELDS, POST_LIST_FIELDS)
+    if any(field in POST_BODY_FIELDS for field in fields):
+        require_login(request)
+    posts = models.Post.objects.filter(is_published=True)
+    if 'author' in request.GET:
+        posts = posts.filter(author__username=request.GET['author'])
+
+    # the paginator's cursor is made from created_at and id
+    paginator = KeysetPaginator(posts.values(*columns(POST_FIELDS, fields, 'created_at', 'id')), page_size(request))
+    try:
+        page = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        raise ApiError(400, "Неверный курсор")
+
+    return json_response({
+        'results': serialize(page, POST_FIELDS, fields),
+        'next': page_url(request, 'after', page.next_cursor),
+        'previous': page_url(request, 'before', page.previous_cursor),
+    })
+
+
+@api_view
+def post_detail(request, slug):
+    require_login(request)
+    fields = requested_fields(request, POST_FIELDS, POST_DETAIL_FIELDS)
+    rows = models.Post.objects.filter(slug=slug, is_published=True).order_by().values(*columns(POST_FIELDS, fields))
+    found = list(rows[:1])
+    if not found:
+        raise ApiError(404, "Пост не найден")
+    return json_response(serialize(found, POST_FIELDS, fields)[0])
+
+
+@api_view
+def author_detail(request, username):
+    require_login(request)
+    fields = requested_fields(request, AUTHOR_FIELDS, AUTHOR_FIELDS)
+    rows = User.objects.filter(username=username, is_active=True).order_by().values(*columns(AUTHOR_FIELDS, fields))
+    found = list(rows[:1])
+    if not found:
+        raise ApiError(404, "Автор не найден")
+    return json_response(serialize(found, AUTHOR_FIELDS, fields)[0])
+
+
+@api_view
+def tagline(request):
+    # the sidebar's copy, usually cached
+    return json_response(get_sidebar()['tagline'])
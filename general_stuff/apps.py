@@ -6,3 +6,5 @@ class GeneralStuffConfig(AppConfig):
     name = 'general_stuff'
     verbose_name = 'core-информация'
 
+    def ready(self):
+        from . import signals  # noqa: F401
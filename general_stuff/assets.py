@@ -0,0 +1,259 @@
+import gzip
+import os
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.utils.functional import cached_property
+
+try:
+    import brotli
+except ImportError:
+    # .br siblings are skipped, .gz is always written
+    brotli = None
+
+# Build step for the CSS: rules whose classes or ids appear nowhere in the
+# templates, scripts or template tags are dropped, the rest is minified.
+# The purge errs on keeping: any word in any scanned file counts as used,
+# so a class only needs to be spelled out somewhere to survive.
+
+# classes only ever added at runtime: bootstrap's own javascript, the
+# message tags in messages.html ("alert-{{ message.tags }}")
+DEFAULT_SAFELIST = (
+    r'^alert-', r'^show$', r'^showing$', r'^hiding$', r'^fade$', r'^collaps',
+    r'^active$', r'^disabled$', r'^modal', r'^dropdown-menu-', r'^tooltip',
+    r'^popover', r'^bs-', r'^carousel-item-', r'^offcanvas', r'^was-validated$',
+    r'^is-valid$', r'^is-invalid$',
+)
+SCANNED_EXTENSIONS = ('.html', '.txt', '.js', '.py')
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.ico', '.json', '.map', '.txt', '.xml', '.html')
+# a sibling that saves less than this isn't worth the extra file
+MIN_COMPRESSION_RATIO = 0.95
+
+_WORD_RE = re.compile(r'[\w-]+')
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_LICENSE_RE = re.compile(r'/\*!.*?\*/', re.S)
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+_CLASS_OR_ID_RE = re.compile(r'[.#](-?[_a-zA-Z][\w-]*)')
+_SPACE_RE = re.compile(r'\s+')
+_DELIMITER_RE = re.compile(r'[{;]')
+# at-rules whose block holds more rules, the rest are kept as they are
+_GROUPING_AT_RULES = ('@media', '@supports', '@container', '@layer')
+
+
+def scanned_dirs():
+    dirs = []
+    for engine in settings.TEMPLATES:
+        dirs += [os.path.join(settings.BASE_DIR, d) for d in engine.get('DIRS', [])]
+    for app in apps.get_app_configs():
+        dirs.append(os.path.join(app.path, 'templates'))
+        # template tags build markup in python
+        if app.name == 'general_stuff':
+            dirs.append(app.path)
+    for directory in settings.STATICFILES_DIRS:
+        dirs.append(os.path.join(settings.BASE_DIR, directory))
+    return [d for d in dirs if os.path.isdir(d)]
+
+
+def used_words(dirs=None):
+    words = set()
+    for directory in dirs or scanned_dirs():
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(SCANNED_EXTENSIONS):
+                    with open(os.path.join(root, name), encoding='utf-8', errors='ignore') as file:
+                        words.update(_WORD_RE.findall(file.read()))
+    return words
+
+
+def _block_end(css, start):
+    # index of the "}" closing the block that opens at css[start - 1]
+    depth = 1
+    i = start
+    while i < len(css):
+        char = css[i]
+        if char in '"\'':
+            i = _STRING_RE.match(css, i).end()
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError('unbalanced braces in stylesheet')
+
+
+def parse(css):
+    """
+    Splits a stylesheet into (prelude, body) pairs; body is a list of the
+    same for grouping at-rules, a string for everything else and None for
+    statements such as @charset.
+    """
+    nodes = []
+    i = 0
+    while i < len(css):
+        match = _DELIMITER_RE.search(css, i)
+        if match is None:
+            break
+        prelude = css[i:match.start()].strip()
+
+        if match.group() == ';':
+            nodes.append((prelude, None))
+            i = match.end()
+            continue
+
+        end = _block_end(css, match.end())
+        body = css[match.end():end]
+        if prelude.startswith(_GROUPING_AT_RULES):
+            body = parse(body)
+        nodes.append((prelude, body))
+        i = end + 1
+    return nodes
+
+
+def _split_top_level(text, separator):
+    parts, depth, start, i = [], 0, 0, 0
+    while i < len(text):
+        char = text[i]
+        if char in '"\'':
+            i = _STRING_RE.match(text, i).end()
+            continue
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _collapse(text):
+    # whitespace runs outside strings become one space
+    result, last = [], 0
+    for match in _STRING_RE.finditer(text):
+        result.append(_SPACE_RE.sub(' ', text[last:match.start()]))
+        result.append(match.group())
+        last = match.end()
+    result.append(_SPACE_RE.sub(' ', text[last:]))
+    return ''.join(result).strip()
+
+
+def minify_declarations(body):
+    declarations = []
+    for declaration in _split_top_level(body, ';'):
+        name, colon, value = declaration.partition(':')
+        if colon and name.strip():
+            declarations.append(f'{name.strip()}:{_collapse(value)}')
+    return ';'.join(declarations)
+
+
+def _selector_used(selector, used, safelist):
+    names = _CLASS_OR_ID_RE.findall(_STRING_RE.sub('', selector))
+    return all(name in used or any(pattern.search(name) for pattern in safelist) for name in names)
+
+
+def render(nodes, used, safelist):
+    out = []
+    for prelude, body in nodes:
+        if body is None:
+            out.append(f'{_collapse(prelude)};')
+        elif isinstance(body, list):
+            inner = render(body, used, safelist)
+            if inner:
+                out.append(f'{_collapse(prelude)}{{{inner}}}')
+        elif prelude.startswith('@'):
+            # @font-face, @keyframes, @page: nothing to purge inside
+            out.append(f'{_collapse(prelude)}{{{_collapse(body)}}}')
+        else:
+            selectors = [
+                _collapse(selector) for selector in _split_top_level(prelude, ',')
+                if _selector_used(selector, used, safelist)
+            ]
+            if selectors:
+                out.append(f"{','.join(selectors)}{{{minify_declarations(body)}}}")
+    return ''.join(out)
+
+
+def purge_css(css, used, safelist=DEFAULT_SAFELIST):
+    """
+    Drops the rules none of whose selectors can match the site's markup
+    and minifies what is left. /*! license */ comments are kept.
+    """
+    licenses = _LICENSE_RE.findall(css)
+    css = _COMMENT_RE.sub('', css)
+    patterns = [re.compile(pattern) for pattern in safelist]
+
+    rules = render(parse(css), used, patterns)
+    # @charset only counts as the very first thing in the file
+    charset = ''
+    if rules.startswith('@charset'):
+        charset, _, rules = rules.partition(';')
+        charset += ';\n'
+    return charset + '\n'.join(licenses + [rules])
+
+
+def compress(path):
+    """
+    Writes .gz (and .br with brotli installed) next to `path`, unless the
+    file doesn't shrink. Returns the names written.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    encoders = [('.gz', lambda content: gzip.compress(content, 9, mtime=0))]
+    if brotli is not None:
+        encoders.append(('.br', lambda content: brotli.compress(content, quality=11)))
+
+    written = []
+    for suffix, encode in encoders:
+        compressed = encode(data)
+        if len(compressed) < len(data) * MIN_COMPRESSION_RATIO:
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that purges and minifies the stylesheets in
+    settings.STATIC_PURGE before they are hashed, and writes compressed
+    siblings of every hashed file for the static view (or nginx
+    gzip_static/brotli_static) to send.
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        purge = [name for name in settings.STATIC_PURGE if name in paths]
+        if purge:
+            used = used_words()
+            for name in purge:
+                with self.open(name) as file:
+                    css = file.read().decode('utf-8')
+                with open(self.path(name), 'w', encoding='utf-8') as file:
+                    file.write(purge_css(css, used, DEFAULT_SAFELIST + tuple(settings.STATIC_PURGE_SAFELIST)))
+            # hashing reads from where a file was found, point it at the purged copy
+            paths = {**paths, **{name: (self, name) for name in purge}}
+
+        hashed = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.append(hashed_name)
+            yield name, hashed_name, processed
+
+        for name in set(hashed):
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                compress(self.path(name))
+
+    @cached_property
+    def hashed_names(self):
+        # what the manifest maps to, safe to cache for a far-future lifetime
+        return frozenset(self.hashed_files.values())
@@ -0,0 +1,145 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.shortcuts import aget_object_or_404, redirect, render
+from . import forms
+from . import models
+from . import profiles
+from .caching import anonymous_page_cache
+from .conditional import conditional_page, home_etag, home_last_modified, post_etag, post_last_modified
+from .context_processors import aget_sidebar
+from .pagination import InvalidCursor, KeysetPaginator
+from .views import AUTHORIZATION_REQUIRED, COMMENTS_PAGE_SIZE, FEED_PAGE_SIZE, FORBIDDEN, search_results
+
+# Async versions of the read views, routed by website/urls_async.py when
+# the site runs under website/asgi.py. They render the same templates with
+# the same context as their counterparts in views.py, without the switch
+# to a sync thread the ASGI handler makes for every sync view. The queries
+# are not any faster: Django's async ORM runs them one after another in
+# its single thread-sensitive executor, so they are awaited in order here.
+
+
+async def resolve_user(request):
+    # the lazy request.user would look the session up again in the sync
+    # thread that renders the template
+    request.user = await request.auser()
+    return request.user
+
+
+async def arender(request, template_name, context):
+    # templates evaluate lazy attributes and run template tags, keep them sync
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def afeed_page(request, posts, per_page=FEED_PAGE_SIZE, ordering=('-created_at', '-id')):
+    paginator = KeysetPaginator(posts, per_page, ordering=ordering)
+    try:
+        return await paginator.aget_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        # stale or hand-made cursor, start over
+        return await paginator.aget_page()
+
+
+@conditional_page(home_etag, home_last_modified)
+@anonymous_page_cache
+async def home(request):
+    search_term = request.GET.get('q')
+
+    if search_term:
+        await resolve_user(request)
+        # the in-process index and ranking are sync code
+        return await sync_to_async(search_results)(request, search_term)
+
+    page = await afeed_page(
+        request, models.Post.objects.filter(is_published=True).select_related('author').defer('text')
+    )
+    sidebar = await aget_sidebar()
+    return await arender(
+        request,
+        "general_stuff/index.html",
+        {
+            'posts': page.object_list,
+            'page': page,
+            'sidebar': sidebar,
+        }
+    )
+
+
+@conditional_page(post_etag, post_last_modified)
+async def post_detail(request, slug):
+    user = await resolve_user(request)
+
+    if user.is_authenticated:
+        # the stored HTML is shown, the text is only loaded for a post not rendered yet
+        post = await aget_object_or_404(models.Post.objects.select_related('author').defer('text'), slug=slug)
+        comments_page = await afeed_page(
+            request,
+            post.comment_set.select_related('author'),
+            per_page=COMMENTS_PAGE_SIZE,
+            ordering=('created_at', 'id'),
+        )
+        sidebar = await aget_sidebar()
+
+        return await arender(
+            request,
+            "general_stuff/post_detail.html",
+            {
+                'title': slug,
+                'post': post,
+                'comments': comments_page,
+                'comment_form': forms.CommentForm(),
+                'sidebar': sidebar,
+            }
+        )
+
+    # case unauthorized
+    messages.warning(request, AUTHORIZATION_REQUIRED)
+    return redirect('/login')
+
+
+async def post_list(request):
+    user = await resolve_user(request)
+
+    if user.is_staff:
+        page = await afeed_page(request, models.Post.objects.select_related('author').defer('text'))
+        sidebar = await aget_sidebar()
+        return await arender(
+            request,
+            "general_stuff/posts.html",
+            {
+                "posts": page.object_list,
+                "page": page,
+                "sidebar": sidebar,
+            }
+        )
+
+    # case forbidden
+    messages.warning(request, FORBIDDEN)
+    return redirect('/', permanent=True)
+
+
+async def user_profile(request, username):
+    user = await resolve_user(request)
+
+    if user.is_authenticated:
+        main_data = await aget_object_or_404(User.objects.select_related('userinfo'), username=username)
+        page = await afeed_page(request, profiles.author_posts(main_data), per_page=profiles.PROFILE_PAGE_SIZE)
+        block = await sync_to_async(profiles.profile_block)(main_data, user.pk == main_data.pk)
+        sidebar = await aget_sidebar()
+
+        return await arender(
+            request,
+            "general_stuff/user_profile.html",
+            {
+                "title": username,
+                "main_data": main_data,
+                "profile_block": block,
+                "posts": page.object_list,
+                "page": page,
+                "sidebar": sidebar,
+            }
+        )
+
+    # case unauthorized
+    messages.warning(request, AUTHORIZATION_REQUIRED)
+    return redirect('/login')
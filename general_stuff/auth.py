@@ -0,0 +1,41 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+# entries are dropped by signals on change; the timeout bounds how long a
+# change the signals don't see (update(), raw SQL, the shell of another
+# deployment) keeps a user signed in as they were
+USER_CACHE_TIMEOUT = 60 * 5
+
+
+def user_cache_key(user_id):
+    return f'general_stuff:user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that resolves the user of every request from the cache,
+    with the profile joined in, so neither costs a query once warm.
+    """
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            # ends the login: ModelBackend, listed next for older sessions,
+            # would hash the same wrong password a second time
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = User._default_manager.select_related('userinfo').filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,122 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+PAGE_VERSION_KEY = 'general_stuff:page-version'
+# keys are versioned, so pages stay correct without a short timeout
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# The version, and the pages, validators, sidebar and media owners cached
+# under it, are only right when every worker reads the same cache: a bump
+# in one process must reach the others. These backends keep entries in
+# the memory of a single process.
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Error(
+        "The default cache is local to each process, workers would serve pages a change in another "
+        "worker has invalidated",
+        hint="Set CACHE_URL to a cache shared by the workers.",
+        id='general_stuff.E001',
+    )]
+
+
+def page_version():
+    version = cache.get(PAGE_VERSION_KEY)
+    if version is None:
+        # nanoseconds, so a flushed or restarted cache never reuses an
+        # old version number, not even within the same second
+        cache.add(PAGE_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(PAGE_VERSION_KEY)
+    return version
+
+
+def bump_page_version():
+    try:
+        cache.incr(PAGE_VERSION_KEY)
+    except ValueError:
+        cache.set(PAGE_VERSION_KEY, time.time_ns(), None)
+
+
+def page_cache_key(request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'general_stuff:page:{page_version()}:{url}'
+
+
+def has_pending_messages(request):
+    storage = getattr(request, '_messages', None)
+    # len() loads stored messages without marking them as shown
+    return storage is not None and len(storage) > 0
+
+
+def is_cacheable(request, response):
+    storage = getattr(request, '_messages', None)
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not response.has_header('Vary')
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and not request.META.get('CSRF_COOKIE_USED')
+        and not (storage is not None and storage.added_new)
+    )
+
+
+def _cached_page(request):
+    """
+    (key, cached response) for a request the cache applies to, (None, None)
+    for one it doesn't.
+    """
+    if (
+        request.method not in ('GET', 'HEAD')
+        or request.user.is_authenticated
+        or has_pending_messages(request)
+    ):
+        return None, None
+
+    key = page_cache_key(request)
+    return key, cache.get(key)
+
+
+def anonymous_page_cache(view):
+    """
+    Caches the rendered page for anonymous GET requests. Pages that show
+    flash messages or hand out a CSRF token are never served from or
+    stored in the cache. Signals bump the version on content changes.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            request.user = await request.auser()
+            # pending messages come out of the session, a sync lookup
+            key, response = await sync_to_async(_cached_page)(request)
+            if response is not None:
+                return response
+
+            response = await view(request, *args, **kwargs)
+            if key and is_cacheable(request, response):
+                await cache.aset(key, response, PAGE_CACHE_TIMEOUT)
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key, response = _cached_page(request)
+        if response is not None:
+            return response
+
+        response = view(request, *args, **kwargs)
+        if key and is_cacheable(request, response):
+            cache.set(key, response, PAGE_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import caching
+from . import models
+
+# Post.comment_count is only ever changed through these helpers, with
+# F() expressions, so concurrent writers never lose an update. Touching
+# updated_at moves the validators of the post and the lists; .update()
+# skips the signals, so the page version behind the cached pages, feeds
+# and sitemap sections is bumped here, once the change is committed.
+
+
+def add_comment(post, author, text):
+    with transaction.atomic():
+        comment = models.Comment.objects.create(post=post, author=author, text=text)
+        models.Post.objects.filter(pk=post.pk).update(
+            comment_count=F('comment_count') + 1, updated_at=timezone.now()
+        )
+        transaction.on_commit(caching.bump_page_version)
+    return comment
+
+
+def delete_comments(comments):
+    with transaction.atomic():
+        per_post = (
+            comments.order_by().values('post').annotate(removed=Count('pk')).values_list('post', 'removed')
+        )
+        for post_id, removed in list(per_post):
+            models.Post.objects.filter(pk=post_id).update(
+                comment_count=F('comment_count') - removed, updated_at=timezone.now()
+            )
+        comments.delete()
+        transaction.on_commit(caching.bump_page_version)
+
+
+def recount_comments(post_ids, touch=True):
+    # for bulk paths that bypass add_comment, e.g. import_content
+    counts = (
+        models.Comment.objects.filter(post=OuterRef('pk'))
+        .order_by().values('post').annotate(n=Count('pk')).values('n')
+    )
+    changes = {'comment_count': Coalesce(Subquery(counts), 0)}
+    if touch:
+        changes['updated_at'] = timezone.now()
+    models.Post.objects.filter(pk__in=post_ids).update(**changes)
+    if touch:
+        transaction.on_commit(caching.bump_page_version)
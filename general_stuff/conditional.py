@@ -0,0 +1,139 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from . import models
+from .caching import has_pending_messages, page_version
+
+# Validators run before the view, a 304 skips the ORM work and the render.
+# They return None when the page can't be revalidated: flash messages are
+# shown once, so a page carrying them must always be rendered.
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _revalidatable(request):
+    return not has_pending_messages(request)
+
+
+def newest_post_queryset():
+    # ORDER BY + LIMIT rather than MAX(), so every backend reads it off
+    # the end of post_published_updated_idx
+    return models.Post.objects.filter(is_published=True).order_by('-updated_at').values_list('updated_at', flat=True)
+
+
+def newest_post(request):
+    # read from the database on every request rather than cached under
+    # the page version, so edits, comments and publishing move the
+    # validators on any worker, whatever the cache holds
+    if not hasattr(request, '_newest_post'):
+        request._newest_post = newest_post_queryset().first()
+    return request._newest_post
+
+
+def home_last_modified(request, **kwargs):
+    # search results carry a "found N posts" message
+    if 'q' in request.GET or not _revalidatable(request):
+        return None
+    return newest_post(request)
+
+
+def home_etag(request, **kwargs):
+    newest = home_last_modified(request)
+    if newest is None:
+        return None
+    # deletes and sidebar changes leave no timestamp, they bump the page
+    # version in the cache all workers share; a flushed cache starts a
+    # new version rather than reusing one, see caching.page_version
+    return make_etag(page_version(), newest.isoformat(), request.user.pk, request.get_full_path())
+
+
+def feed_last_modified(request, **kwargs):
+    return newest_post(request)
+
+
+def feed_etag(request, **kwargs):
+    newest = feed_last_modified(request)
+    if newest is None:
+        return None
+    return make_etag(page_version(), newest.isoformat(), request.build_absolute_uri())
+
+
+def _post_validator(request, slug):
+    if not hasattr(request, '_post_validator'):
+        request._post_validator = models.Post.objects.filter(
+            slug=slug
+        ).order_by().values_list('updated_at', flat=True).first()
+    return request._post_validator
+
+
+def post_last_modified(request, slug):
+    # anonymous visitors are redirected to the login page
+    if not request.user.is_authenticated or not _revalidatable(request):
+        return None
+    return _post_validator(request, slug)
+
+
+def post_etag(request, slug):
+    updated_at = post_last_modified(request, slug)
+    if updated_at is None:
+        return None
+    # comments move updated_at and are paged through the query string,
+    # the page version covers the sidebar
+    return make_etag(page_version(), updated_at.isoformat(), request.user.pk, request.get_full_path())
+
+
+def conditional_page(etag_func, last_modified_func):
+    """
+    condition() plus Cache-Control: no-cache, so browsers and the proxy
+    revalidate every time instead of guessing a freshness lifetime.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_conditional_page(view, etag_func, last_modified_func)
+
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, no_cache=True, private=request.user.is_authenticated)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _async_conditional_page(view, etag_func, last_modified_func):
+    # condition() calls the validators on the event loop, but they read
+    # the session and the database; compute them in a thread and hand
+    # condition() the results
+    def validate(request, *args, **kwargs):
+        return (
+            etag_func(request, *args, **kwargs),
+            last_modified_func(request, *args, **kwargs),
+            request.user.is_authenticated,
+        )
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # resolved once, the lazy request.user and auser() cache separately
+        request.user = await request.auser()
+        etag, last_modified, authenticated = await sync_to_async(validate)(request, *args, **kwargs)
+        conditional_view = condition(
+            etag_func=lambda *args, **kwargs: etag,
+            last_modified_func=lambda *args, **kwargs: last_modified,
+        )(view)
+
+        response = await conditional_view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, no_cache=True, private=authenticated)
+        return response
+
+    return wrapper
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from . import models
+
+SIDEBAR_CACHE_KEY = 'general_stuff:sidebar'
+# signals from signals.py drop the key on every change, in the cache all
+# workers share (see caching.PROCESS_LOCAL_CACHES); the timeout only
+# bounds changes the signals don't see
+SIDEBAR_CACHE_TIMEOUT = 60 * 60
+
+
+def dreamteam_queryset():
+    # served by the partial userinfo_dream_team_idx
+    return models.UserInfo.objects.filter(dream_team=True).values_list('user__username', flat=True)
+
+
+def get_sidebar():
+    data = cache.get(SIDEBAR_CACHE_KEY)
+
+    if data is None:
+        data = {
+            'tagline': models.Tagline.objects.values('title', 'text').first(),
+            'dreamteam': list(dreamteam_queryset()),
+        }
+        cache.set(SIDEBAR_CACHE_KEY, data, SIDEBAR_CACHE_TIMEOUT)
+
+    return data
+
+
+async def aget_sidebar():
+    # for the async read views; on a cold cache the two queries still run
+    # one after another, the async ORM hands each to the same sync thread
+    data = await cache.aget(SIDEBAR_CACHE_KEY)
+
+    if data is None:
+        data = {
+            'tagline': await models.Tagline.objects.values('title', 'text').afirst(),
+            'dreamteam': [username async for username in dreamteam_queryset()],
+        }
+        await cache.aset(SIDEBAR_CACHE_KEY, data, SIDEBAR_CACHE_TIMEOUT)
+
+    return data
+
+
+def sidebar(request):
+    # lazy, so pages without side_widget.html don't touch the cache at all
+    return {'sidebar': SimpleLazyObject(get_sidebar)}
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+# DATABASES[alias]['POOL'] overrides these
+POOL_DEFAULTS = {
+    # connections one process may have out at once
+    'MAX_SIZE': 4,
+    # seconds a request waits for a free connection before failing
+    'TIMEOUT': 10,
+    # an idle connection unused this long is pinged before it is reused,
+    # the server or a proxy in between may have dropped it
+    'CHECK_AFTER': 30,
+    # connections are reopened after this long, so they spread again
+    # after a failover or a pgbouncer restart
+    'MAX_LIFETIME': 60 * 60,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Connections to one database from one process. A semaphore bounds how
+    many are out, the rest wait in `idle` for the next request.
+    """
+    def __init__(self, max_size, timeout, check_after, max_lifetime):
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.opened_at = {}
+
+    def acquire(self, connect):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                f"no free database connection after {self.timeout}s, the pool holds at most "
+                f"its MAX_SIZE per process"
+            )
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, returned_at = self.idle.pop()
+                if self.usable(connection, returned_at):
+                    return connection
+                self.discard(connection)
+
+            connection = connect()
+            self.opened_at[connection] = time.monotonic()
+            return connection
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection, reuse=True):
+        try:
+            if reuse and self.reset(connection):
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+            else:
+                self.discard(connection)
+        finally:
+            self.slots.release()
+
+    def usable(self, connection, returned_at):
+        now = time.monotonic()
+        if connection.closed or now - self.opened_at.get(connection, now) > self.max_lifetime:
+            return False
+        if now - returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def reset(self, connection):
+        # nothing left open for the next request to inherit
+        if connection.closed:
+            return False
+        if connection.info.transaction_status == TRANSACTION_STATUS_IDLE:
+            return True
+        try:
+            connection.rollback()
+        except base.Database.Error:
+            return False
+        return connection.info.transaction_status == TRANSACTION_STATUS_IDLE
+
+    def discard(self, connection):
+        self.opened_at.pop(connection, None)
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend with connections borrowed from a per-process
+    pool. Closing one, as Django does at the end of every request with
+    CONN_MAX_AGE = 0, hands it back instead of dropping it.
+    """
+    def get_pool(self, conn_params):
+        # per process, a forked worker must not share its parent's sockets;
+        # per target, the test runner switches NAME to the test database
+        key = (os.getpid(), self.alias, tuple(sorted(conn_params.items())))
+        with _pools_lock:
+            if key not in _pools:
+                options = {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+                _pools[key] = ConnectionPool(
+                    options['MAX_SIZE'], options['TIMEOUT'], options['CHECK_AFTER'], options['MAX_LIFETIME']
+                )
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        self._connection_pool = self.get_pool(conn_params)
+        connect = super().get_new_connection
+        return self._connection_pool.acquire(lambda: connect(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            # closed inside atomic(), the wrapper holds on to the connection
+            # until it rolls back, so it can't go to anyone else
+            self._connection_pool.release(self.connection, reuse=not self.in_atomic_block)
@@ -0,0 +1,46 @@
+from django.contrib.syndication.views import Feed
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from . import models
+from .caching import anonymous_page_cache
+from .conditional import conditional_page, feed_etag, feed_last_modified
+
+FEED_ITEMS = 20
+
+
+class LatestPostsFeed(Feed):
+    title = 'Legends Never Die'
+    description = 'Новые посты'
+
+    def link(self):
+        return reverse('home')
+
+    def items(self):
+        # the home page order, off post_published_feed_idx
+        return models.Post.objects.filter(is_published=True).select_related('author').defer('text')[:FEED_ITEMS]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt
+
+    def item_pubdate(self, item):
+        return item.created_at
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+
+class AtomLatestPostsFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+# built once per page version, which every post change bumps, comments
+# too; a feed reader polling with its ETag gets a 304
+rss = conditional_page(feed_etag, feed_last_modified)(anonymous_page_cache(LatestPostsFeed()))
+atom = conditional_page(feed_etag, feed_last_modified)(anonymous_page_cache(AtomLatestPostsFeed()))
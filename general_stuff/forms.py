@@ -24,6 +24,14 @@ class PostUpdateForm(forms.ModelForm):
         fields =  ['title', 'text', 'image', 'is_published']
 
 
+class CommentForm(forms.ModelForm):
+    class Meta:
+        model = models.Comment
+        fields = ['text']
+        labels = {'text': ''}
+        widgets = {'text': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Ваш комментарий...'})}
+
+
 class TaglineForm(forms.ModelForm):
     class Meta:
         model = models.Tagline
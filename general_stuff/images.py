@@ -0,0 +1,166 @@
+import base64
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, router, transaction
+from PIL import Image, ImageFilter, ImageOps
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 960, 1280)
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+VARIANTS_DIR = 'variants'
+PLACEHOLDER_WIDTH = 16
+
+_executor = None
+_executor_lock = Lock()
+_pending = set()
+
+
+def render_variants(data):
+    """
+    Resizes raw image bytes into every width/format pair plus a blurred
+    placeholder. Runs inside the process pool, so it must stay free of
+    Django models and settings.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+
+    width, height = image.size
+    widths = [w for w in VARIANT_WIDTHS if w < width] or [width]
+    if width < VARIANT_WIDTHS[-1] and width not in widths:
+        widths.append(width)
+
+    variants = []
+    for target in widths:
+        resized = image.resize((target, max(round(height * target / width), 1)), Image.LANCZOS)
+        for extension, pil_format, options in VARIANT_FORMATS:
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            variants.append((extension, target, buffer.getvalue()))
+
+    tiny = image.resize(
+        (PLACEHOLDER_WIDTH, max(round(height * PLACEHOLDER_WIDTH / width), 1))
+    ).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'JPEG', quality=40)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+    return width, height, variants, placeholder
+
+
+def variant_names(manifest):
+    for sources in manifest.get('sources', {}).values():
+        for _, name in sources:
+            yield name
+
+
+def delete_variants(storage, manifest):
+    for name in variant_names(manifest or {}):
+        storage.delete(name)
+
+
+def save_variants(field_file, rendered):
+    width, height, variants, placeholder = rendered
+    storage = field_file.storage
+    stem = os.path.splitext(field_file.name)[0]
+
+    sources = {}
+    for extension, target, content in variants:
+        name = storage.save(f'{VARIANTS_DIR}/{stem}_{target}w.{extension}', ContentFile(content))
+        sources.setdefault(extension, []).append((target, name))
+
+    return {
+        'source': field_file.name,
+        'width': width,
+        'height': height,
+        'placeholder': placeholder,
+        'sources': sources,
+    }
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a threaded server process is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _store(model, pk, file_field, manifest_field, field_file, rendered):
+    manifest = save_variants(field_file, rendered)
+
+    # skipped if another image was uploaded while this one was rendering
+    updated = model._default_manager.filter(
+        pk=pk, **{file_field: field_file.name}
+    ).update(**{manifest_field: manifest})
+
+    if not updated:
+        delete_variants(field_file.storage, manifest)
+    else:
+        # .update() skips the signals, cached pages still point to the original
+        caching.bump_page_version()
+    return manifest
+
+
+def build_variants(instance, file_field, manifest_field, wait=False, force=False):
+    """
+    Schedules variant rendering for `instance.<file_field>` and stores the
+    manifest in `instance.<manifest_field>` once the pool is done. Old
+    variants are removed when the image was replaced or cleared.
+    """
+    field_file = getattr(instance, file_field)
+    manifest = getattr(instance, manifest_field) or {}
+
+    if not force and manifest.get('source') == (field_file.name or None):
+        return
+    if manifest:
+        delete_variants(field_file.storage, manifest)
+        type(instance)._default_manager.filter(pk=instance.pk).update(**{manifest_field: {}})
+    if not field_file:
+        return
+
+    key = (type(instance), instance.pk, field_file.name)
+    if key in _pending:
+        return
+
+    with field_file.storage.open(field_file.name, 'rb') as source:
+        data = source.read()
+
+    model, pk = type(instance), instance.pk
+    if wait or not settings.IMAGE_VARIANT_WORKERS:
+        return _store(model, pk, file_field, manifest_field, field_file, render_variants(data))
+
+    def done(future):
+        _pending.discard(key)
+        try:
+            _store(model, pk, file_field, manifest_field, field_file, future.result())
+        except Exception:
+            logger.exception('Could not build variants for %s', field_file.name)
+        finally:
+            connections.close_all()
+
+    def submit():
+        _pending.add(key)
+        _get_executor().submit(render_variants, data).add_done_callback(done)
+
+    # the callback runs on another connection, which only sees the new
+    # image once the saving transaction commits; before that its
+    # .update() matches nothing and the variants are thrown away
+    transaction.on_commit(submit, using=router.db_for_write(model))
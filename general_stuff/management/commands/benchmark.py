@@ -0,0 +1,284 @@
+import asyncio
+import json
+import math
+import platform
+import re
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import django
+from asgiref.sync import ThreadSensitiveContext, async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from general_stuff import models
+from general_stuff.pagination import KeysetPaginator
+from general_stuff.views import FEED_PAGE_SIZE
+
+# kept in sync with website/asgi.py, importing it would build the application
+ASYNC_URLCONF = 'website.urls_async'
+
+PERCENTILES = (50, 95, 99)
+
+# PerformanceMiddleware counts queries wherever the view runs them, the
+# benchmark reads the count back from its Server-Timing header
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def query_count(response):
+    match = QUERIES_RE.search(response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+def percentile(ordered, p):
+    # nearest rank, so p99 of 100 samples is the slowest but one
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def scenarios():
+    """
+    (name, path, needs login) for the pages worth measuring, pointed at
+    rows that exist in the current database.
+    """
+    published = models.Post.objects.filter(is_published=True)
+    post = published.select_related('author').order_by('-created_at', '-id').first()
+    next_cursor = KeysetPaginator(published, FEED_PAGE_SIZE).get_page().next_cursor
+    home = reverse('home')
+
+    pages = [
+        ('home', home, False),
+        ('search', f"{home}?{urlencode({'q': 'дождь музыка'})}", False),
+        ('load more', reverse('load-more'), False),
+        ('about', reverse('about'), False),
+        ('posts', reverse('posts'), True),
+    ]
+    if next_cursor:
+        pages.append(('home, next page', f'{home}?after={next_cursor}', False))
+    if post:
+        pages += [
+            ('post detail', post.get_absolute_url(), True),
+            ('user profile', reverse('user-profile', kwargs={'username': post.author.username}), True),
+        ]
+
+    # the changelists, as a superuser sees them
+    admin_posts = reverse('admin:general_stuff_post_changelist')
+    pages += [
+        ('admin posts', admin_posts, True),
+        ('admin comments', reverse('admin:general_stuff_comment_changelist'), True),
+    ]
+    if post:
+        pages += [
+            ('admin posts, search', f"{admin_posts}?{urlencode({'q': post.author.username})}", True),
+            ('admin posts, year', f"{admin_posts}?{urlencode({'created_at__year': post.created_at.year})}", True),
+        ]
+    return pages
+
+
+def cold_caches():
+    prefix = f'benchmark-{uuid.uuid4().hex}'
+    return {
+        alias: {**options, 'KEY_PREFIX': ':'.join(filter(None, [options.get('KEY_PREFIX'), prefix]))}
+        for alias, options in settings.CACHES.items()
+    }
+
+
+def summarize(path, samples, wall):
+    ordered = sorted(elapsed for elapsed, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    summary = {
+        'path': path,
+        'requests': len(samples),
+        'errors': sum(status >= 400 for _, status, _ in samples),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'throughput_rps': round(len(samples) / wall, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(percentile(ordered, p) * 1000, 2)
+    return summary
+
+
+class Command(BaseCommand):
+    help = "Drives the site's pages concurrently through the in-process client and reports latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per page")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--asgi', action='store_true', help="Go through the ASGI handler instead of WSGI")
+        parser.add_argument(
+            '--async-views', action='store_true',
+            help="With --asgi, route the read pages to their async views as website/asgi.py does",
+        )
+        parser.add_argument('--username', help="Who the pages behind login are requested as, default the first superuser or staff user")
+        parser.add_argument('--only', action='append', metavar='PAGE', help="Measure only these pages")
+        parser.add_argument('--output', help="Where to save the JSON results")
+        parser.add_argument('--compare', metavar='FILE', help="Earlier results to print the difference against")
+
+    def login_user(self, username):
+        users = User.objects.filter(is_active=True)
+        if username:
+            return users.filter(username=username).first()
+        # a superuser sees the admin pages too
+        return users.filter(is_staff=True).order_by('-is_superuser', 'pk').first()
+
+    def session_cookies(self, user):
+        # one session shared by every worker, logging in per worker would
+        # only measure session inserts
+        if not user:
+            return None
+        client = Client()
+        client.force_login(user)
+        return client.cookies
+
+    def make_client(self, client_class, cookies):
+        # a failing page is counted as an error, not raised
+        client = client_class(raise_request_exception=False)
+        if cookies:
+            client.cookies = SimpleCookie(cookies)
+        return client
+
+    def run_wsgi(self, path, cookies, total, concurrency):
+        def worker(count):
+            client = self.make_client(Client, cookies)
+            samples = []
+            try:
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = client.get(path)
+                    samples.append((time.perf_counter() - start, response.status_code, query_count(response)))
+            finally:
+                # every thread opened its own connection
+                connection.close()
+            return samples
+
+        shares = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(worker, [share for share in shares if share]))
+        return [sample for samples in results for sample in samples], time.perf_counter() - start
+
+    def run_asgi(self, path, cookies, total, concurrency):
+        client = self.make_client(AsyncClient, cookies)
+        limit = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one():
+            # a server gives every request its own thread for sync code,
+            # the test client alone would run them all on this one
+            async with limit, ThreadSensitiveContext():
+                start = time.perf_counter()
+                response = await client.get(path)
+                samples.append((time.perf_counter() - start, response.status_code, query_count(response)))
+
+        async def run():
+            await asyncio.gather(*(one() for _ in range(total)))
+
+        start = time.perf_counter()
+        async_to_sync(run)()
+        return samples, time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        user = self.login_user(options['username'])
+        if options['username'] and not user:
+            raise CommandError(f"no active user {options['username']!r}")
+
+        pages = scenarios()
+        if options['only']:
+            pages = [page for page in pages if page[0] in options['only']]
+        run = self.run_asgi if options['asgi'] else self.run_wsgi
+        handler = 'asgi' if options['asgi'] else 'wsgi'
+
+        overrides = {
+            # both clients send Host: testserver, as under the test runner
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            # the query counts come from Server-Timing, anonymous pages too
+            'SERVER_TIMING_PUBLIC': True,
+        }
+        if options['async_views']:
+            if not options['asgi']:
+                raise CommandError("--async-views needs --asgi")
+            overrides['ROOT_URLCONF'] = ASYNC_URLCONF
+            handler = 'asgi+async-views'
+
+        results = {}
+        with override_settings(**overrides):
+            for name, path, needs_login in pages:
+                if needs_login and not user:
+                    self.stderr.write(f"{name}: skipped, there is no staff user to log in as")
+                    continue
+                results[name] = self.run_page(run, path, user if needs_login else None, options)
+                self.report(name, results[name])
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'handler': handler,
+            'concurrency': options['concurrency'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'pages': results,
+        }
+
+        output = options['output'] or f"benchmark-{report['commit'] or 'nocommit'}-{timezone.now():%Y%m%d%H%M%S}.json"
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f"saved to {output}")
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run_page(self, run, path, user, options):
+        # the first request renders, the rest show the warm path; a key
+        # prefix of its own starts every page on a cold cache, clear()
+        # would also drop the sessions and pages the site has cached
+        with override_settings(CACHES=cold_caches()):
+            samples, wall = run(path, self.session_cookies(user), options['requests'], options['concurrency'])
+        return summarize(path, samples, wall)
+
+    def report(self, name, summary):
+        percentiles = ' '.join(f"p{p} {summary[f'p{p}_ms']}ms" for p in PERCENTILES)
+        line = (
+            f"{name}: {percentiles}, {summary['throughput_rps']} req/s, "
+            f"{summary['queries_per_request']} queries/req"
+        )
+        if summary['errors']:
+            line += f", {summary['errors']} errors"
+        self.stdout.write(line)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            before = json.load(file)
+        self.stdout.write(f"against {before.get('commit')} ({before.get('handler')}):")
+
+        for name, summary in results.items():
+            old = before['pages'].get(name)
+            if not old:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'throughput_rps', 'queries_per_request'):
+                if old.get(key) and summary[key] is not None:
+                    changes.append(f"{key} {(summary[key] - old[key]) / old[key]:+.0%}")
+            self.stdout.write(f"  {name}: {', '.join(changes)}")
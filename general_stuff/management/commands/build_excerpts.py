@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from general_stuff import caching
+from general_stuff import models
+
+
+class Command(BaseCommand):
+    help = "Fills in the excerpts of posts saved before they existed, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help="Rebuild every excerpt, e.g. after changing their length")
+
+    def handle(self, *args, **options):
+        posts = models.Post.objects.all()
+        if not options['all']:
+            posts = posts.filter(excerpt='').exclude(text='')
+
+        changed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last_pk).order_by('pk').only('pk', 'text', 'excerpt', 'short_excerpt')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            updated = []
+            for post in batch:
+                old = (post.excerpt, post.short_excerpt)
+                post.refresh_excerpts()
+                if (post.excerpt, post.short_excerpt) != old:
+                    updated.append(post)
+
+            if updated:
+                # bulk_update leaves updated_at alone, nothing was edited
+                with transaction.atomic():
+                    models.Post.objects.bulk_update(updated, ['excerpt', 'short_excerpt'])
+            changed += len(updated)
+
+        if changed:
+            # bulk_update skips the signals
+            caching.bump_page_version()
+        self.stdout.write(f"{changed} excerpts built")
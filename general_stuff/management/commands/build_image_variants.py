@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from general_stuff import images
+from general_stuff import models
+
+TARGETS = (
+    (models.Post, 'image', 'image_variants'),
+    (models.UserInfo, 'avatar', 'avatar_variants'),
+)
+
+
+class Command(BaseCommand):
+    help = "Renders resized variants for post images and avatars uploaded before the pipeline existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild variants that already exist")
+
+    def handle(self, *args, **options):
+        for model, file_field, manifest_field in TARGETS:
+            built = 0
+            queryset = model.objects.exclude(**{file_field: ''}).exclude(**{f'{file_field}__isnull': True})
+
+            for instance in queryset.only('pk', file_field, manifest_field).iterator(chunk_size=200):
+                try:
+                    if images.build_variants(
+                        instance, file_field, manifest_field, wait=True, force=options['force']
+                    ):
+                        built += 1
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f"{model.__name__} {instance.pk}: {error}")
+
+            self.stdout.write(f"{model.__name__}: {built} rebuilt")
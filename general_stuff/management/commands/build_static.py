@@ -0,0 +1,43 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from general_stuff import assets
+
+PIPELINE_STORAGE = 'general_stuff.assets.PrecompressedManifestStaticFilesStorage'
+
+
+class Command(BaseCommand):
+    help = "Collects static files into STATIC_ROOT purged, minified, hashed and precompressed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="Remove the previous build first")
+
+    def handle(self, *args, **options):
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': PIPELINE_STORAGE}}
+
+        # the same build whatever DEBUG picks for serving
+        with override_settings(STORAGES=storages):
+            call_command('collectstatic', interactive=False, clear=options['clear'], verbosity=0)
+
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            for name in settings.STATIC_PURGE:
+                source = self.source_size(name)
+                hashed = staticfiles_storage.stored_name(name)
+                self.report(name, hashed, source, staticfiles_storage.path(hashed))
+
+        if assets.brotli is None:
+            self.stdout.write("brotli is not installed, only .gz files were written")
+
+    def source_size(self, name):
+        from django.contrib.staticfiles import finders
+        return os.path.getsize(finders.find(name))
+
+    def report(self, name, hashed, source, built):
+        sizes = [f"{os.path.getsize(built) // 1024} KiB minified"]
+        for suffix in ('.gz', '.br'):
+            if os.path.exists(built + suffix):
+                sizes.append(f"{os.path.getsize(built + suffix) // 1024} KiB {suffix}")
+        self.stdout.write(f"{name} -> {hashed}: {source // 1024} KiB, {', '.join(sizes)}")
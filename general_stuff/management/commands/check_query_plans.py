@@ -0,0 +1,120 @@
+import re
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from general_stuff import conditional
+from general_stuff import models
+from general_stuff import profiles
+from general_stuff import seeding
+from general_stuff.context_processors import dreamteam_queryset
+from general_stuff.pagination import KeysetPaginator
+from general_stuff.views import COMMENTS_PAGE_SIZE, FEED_PAGE_SIZE
+
+ADMIN_PAGE_SIZE = admin.ModelAdmin.list_per_page
+
+# plan lines that mean a table was read in full or sorted after reading
+BAD_PLAN_LINES = {
+    'postgresql': [
+        re.compile(r'Seq Scan on (?P<table>\w+)'),
+        re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b'),
+    ],
+    'sqlite': [
+        re.compile(r'\bSCAN (?P<table>\w+)\s*$'),
+        re.compile(r'USE TEMP B-TREE'),
+    ],
+}
+
+
+def hot_queries():
+    """
+    The queries behind the busiest pages, built the same way the views
+    build them, with cursors taken from real rows.
+    """
+    published = models.Post.objects.filter(is_published=True).select_related('author')
+    feed = KeysetPaginator(published, FEED_PAGE_SIZE)
+    staff_feed = KeysetPaginator(models.Post.objects.select_related('author'), FEED_PAGE_SIZE)
+
+    # a row from the middle of the feed, so the seek isn't trivially empty
+    middle = published.order_by(*feed.ordering).values('created_at', 'id')[FEED_PAGE_SIZE * 10:][:1].first()
+    post = models.Post.objects.filter(comment_count__gt=0).order_by('-comment_count').only('pk').first()
+    image = models.Post.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True).first()
+    author = models.Post.objects.filter(is_published=True).values_list('author_id', flat=True).first()
+
+    queries = {
+        'home': published.order_by(*feed.ordering)[:FEED_PAGE_SIZE + 1],
+        'staff posts': staff_feed.queryset.order_by(*staff_feed.ordering)[:FEED_PAGE_SIZE + 1],
+        'newest post': conditional.newest_post_queryset()[:1],
+        'post detail': models.Post.objects.select_related('author').filter(slug='seed'),
+        'dream team': dreamteam_queryset(),
+    }
+    if middle:
+        # the admin changelist's date_hierarchy, see admin.py
+        year = middle['created_at'].year
+        queries['admin posts, year'] = (
+            models.Post.objects.select_related('author').filter(created_at__year=year)
+            .order_by(*feed.ordering)[:ADMIN_PAGE_SIZE]
+        )
+        queries['home, next page'] = (
+            published.filter(feed._seek(feed.key(middle), forward=True)).order_by(*feed.ordering)[:FEED_PAGE_SIZE + 1]
+        )
+    if image:
+        queries['media owners'] = models.Post.objects.filter(image=image).order_by().values_list('is_published', 'author_id')
+    if author:
+        queries['user profile posts'] = (
+            published.filter(author_id=author).order_by(*feed.ordering)[:profiles.PROFILE_PAGE_SIZE + 1]
+        )
+    if post:
+        queries['comments'] = (
+            models.Comment.objects.filter(post=post).select_related('author')
+            .order_by('created_at', 'id')[:COMMENTS_PAGE_SIZE + 1]
+        )
+    return queries
+
+
+def bad_lines(plan, vendor):
+    patterns = BAD_PLAN_LINES.get(vendor, [])
+    return [line for line in plan.splitlines() if any(pattern.search(line) for pattern in patterns)]
+
+
+class Command(BaseCommand):
+    help = "EXPLAINs the hot queries and fails if any of them reads a whole table or sorts without an index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, metavar='POSTS', help="Seed this many posts first")
+        parser.add_argument('--comments-per-post', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in BAD_PLAN_LINES:
+            raise CommandError(f"don't know how to read {vendor} plans")
+
+        if options['seed']:
+            created = seeding.seed(
+                users=max(options['seed'] // 20, 10),
+                posts=options['seed'],
+                comments_per_post=options['comments_per_post'],
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write(', '.join(f'{count} {name}' for name, count in created.items()) + ' seeded')
+
+        # planners pick sequential scans on tables they have no statistics for
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        failed = []
+        for name, queryset in hot_queries().items():
+            plan = queryset.explain()
+            problems = bad_lines(plan, vendor)
+
+            if problems:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: FAIL'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            if problems or options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        if failed:
+            raise CommandError(f"no index used by: {', '.join(failed)}")
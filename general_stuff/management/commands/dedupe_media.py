@@ -0,0 +1,83 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from general_stuff import auth
+from general_stuff import caching
+from general_stuff import media
+from general_stuff import models
+from general_stuff import profiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves images and avatars uploaded before the content-addressed storage into it, one file per "
+        "content, then recounts blob references and removes unused blobs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep-originals', action='store_true', help="Leave the moved files where they were")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, media.ContentAddressedStorage):
+            raise CommandError("STORAGES['default'] is not general_stuff.media.ContentAddressedStorage")
+
+        moved = {}
+        for model, field, _ in media.REFERENCES:
+            names = (
+                model._default_manager.exclude(**{f'{field}__startswith': f'{media.BLOB_DIR}/'})
+                .exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .order_by().values_list(field, flat=True).distinct()
+            )
+            for name in names:
+                if name in moved:
+                    continue
+                if not default_storage.exists(name):
+                    self.stderr.write(f"missing media: {name}")
+                    continue
+                with default_storage.open(name, 'rb') as original:
+                    moved[name] = default_storage.save(name, original)
+
+        for model, field, manifest_field in media.REFERENCES:
+            for old, new in moved.items():
+                self.repoint(model, field, manifest_field, old, new, options['batch_size'])
+
+        freed = 0
+        if not options['keep_originals']:
+            for name in moved:
+                freed += default_storage.size(name)
+                default_storage.delete(name)
+            freed -= sum(models.MediaBlob.objects.filter(name__in=set(moved.values())).values_list('size', flat=True))
+
+        media.recount()
+        removed = media.collect(verify=False)
+
+        if moved:
+            # bulk_update() skips the signals, cached pages and profiles still
+            # link to the old names
+            caching.bump_page_version()
+            owners = models.UserInfo.objects.filter(avatar__in=set(moved.values())).values_list('user_id', flat=True)
+            for user_id in owners:
+                auth.forget_user(user_id)
+                profiles.forget_profile_block(user_id)
+
+        self.stdout.write(
+            f"{len(moved)} files moved into {len(set(moved.values()))} blobs, {freed} bytes freed, "
+            f"{len(removed)} unused blobs removed"
+        )
+
+    def repoint(self, model, field, manifest_field, old, new, batch_size):
+        # rows leave the filter as they are updated, so every pass reads the next ones
+        rows = model._default_manager.filter(**{field: old}).order_by('pk').only('pk', field, manifest_field)
+        while True:
+            batch = list(rows[:batch_size])
+            if not batch:
+                break
+            for row in batch:
+                setattr(row, field, new)
+                # the variants stay valid, they were rendered from the same content
+                manifest = getattr(row, manifest_field)
+                if manifest.get('source') == old:
+                    manifest['source'] = new
+            with transaction.atomic():
+                model._default_manager.bulk_update(batch, [field, manifest_field])
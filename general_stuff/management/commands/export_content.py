@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from general_stuff import models
+
+CONTENT_FILE = 'content.jsonl'
+MEDIA_MANIFEST_FILE = 'media_manifest.jsonl'
+CHUNK_SIZE = 2000
+
+# record type -> (queryset, {record key: lookup}), dumped in this order so
+# that every foreign key points to an already imported record
+EXPORTS = (
+    ('user', User.objects.all(), {
+        'username': 'username',
+        'email': 'email',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'password': 'password',
+        'is_staff': 'is_staff',
+        'is_superuser': 'is_superuser',
+        'is_active': 'is_active',
+        'date_joined': 'date_joined',
+        'last_login': 'last_login',
+    }),
+    ('userinfo', models.UserInfo.objects.all(), {
+        'user': 'user__username',
+        'phone_number': 'phone_number',
+        'bio': 'bio',
+        'status': 'status',
+        'avatar': 'avatar',
+        'dream_team': 'dream_team',
+    }),
+    ('post', models.Post.objects.all(), {
+        'slug': 'slug',
+        'title': 'title',
+        'text': 'text',
+        'image': 'image',
+        'is_published': 'is_published',
+        'author': 'author__username',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }),
+    ('comment', models.Comment.objects.all(), {
+        'post': 'post__slug',
+        'author': 'author__username',
+        'text': 'text',
+        'created_at': 'created_at',
+    }),
+)
+
+MEDIA_FIELDS = (
+    (models.Post, 'image'),
+    (models.UserInfo, 'avatar'),
+)
+
+
+def encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # phone numbers and anything else with a canonical text form
+    return str(value)
+
+
+def file_digest(name):
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as media:
+        for chunk in media.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    help = "Streams users, profiles, posts and comments to JSONL plus a manifest of the media they use"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--skip-media', action='store_true', help="Don't write the media manifest")
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, CONTENT_FILE), 'w', encoding='utf-8') as output:
+            for record_type, queryset, fields in EXPORTS:
+                rows = queryset.order_by('pk').values_list(*fields.values())
+                written = 0
+
+                for row in rows.iterator(chunk_size=CHUNK_SIZE):
+                    record = {'type': record_type, **dict(zip(fields, row))}
+                    output.write(json.dumps(record, ensure_ascii=False, default=encode))
+                    output.write('\n')
+                    written += 1
+
+                self.stdout.write(f"{record_type}: {written}")
+
+        if options['skip_media']:
+            return
+
+        with open(os.path.join(directory, MEDIA_MANIFEST_FILE), 'w', encoding='utf-8') as manifest:
+            files = 0
+            for model, field in MEDIA_FIELDS:
+                names = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                names = names.order_by().values_list(field, flat=True).distinct()
+
+                for name in names.iterator(chunk_size=CHUNK_SIZE):
+                    if not default_storage.exists(name):
+                        self.stderr.write(f"missing media: {name}")
+                        continue
+                    entry = {'name': name, 'size': default_storage.size(name), 'sha256': file_digest(name)}
+                    manifest.write(json.dumps(entry, ensure_ascii=False))
+                    manifest.write('\n')
+                    files += 1
+
+            self.stdout.write(f"media files: {files}")
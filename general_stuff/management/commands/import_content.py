@@ -0,0 +1,275 @@
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from general_stuff import caching
+from general_stuff import comments
+from general_stuff import models
+from general_stuff.bulk import preserve_timestamps
+from general_stuff.management.commands.export_content import CONTENT_FILE, MEDIA_MANIFEST_FILE, file_digest
+
+CHECKPOINT_FILE = 'import.checkpoint'
+
+
+def parse_optional_datetime(value):
+    return parse_datetime(value) if value else None
+
+
+def user_ids(usernames):
+    return dict(User.objects.filter(username__in=set(usernames)).values_list('username', 'id'))
+
+
+def post_ids(slugs):
+    return dict(models.Post.objects.filter(slug__in=set(slugs)).values_list('slug', 'id'))
+
+
+def build_users(records):
+    return [
+        User(
+            username=record['username'],
+            email=record['email'],
+            first_name=record['first_name'],
+            last_name=record['last_name'],
+            password=record['password'],
+            is_staff=record['is_staff'],
+            is_superuser=record['is_superuser'],
+            is_active=record['is_active'],
+            date_joined=parse_datetime(record['date_joined']),
+            last_login=parse_optional_datetime(record['last_login']),
+        )
+        for record in records
+    ]
+
+
+def build_userinfos(records):
+    users = user_ids(record['user'] for record in records)
+    return [
+        models.UserInfo(
+            user_id=users[record['user']],
+            phone_number=record['phone_number'],
+            bio=record['bio'],
+            status=record['status'],
+            avatar=record['avatar'],
+            dream_team=record['dream_team'],
+        )
+        for record in records
+        if record['user'] in users
+    ]
+
+
+def build_posts(records):
+    authors = user_ids(record['author'] for record in records)
+    posts = [
+        models.Post(
+            slug=record['slug'],
+            title=record['title'],
+            text=record['text'],
+            image=record['image'],
+            is_published=record['is_published'],
+            author_id=authors[record['author']],
+            created_at=parse_datetime(record['created_at']),
+            updated_at=parse_datetime(record['updated_at']),
+        )
+        for record in records
+        if record['author'] in authors
+    ]
+    # bulk_create skips save(), which fills these in
+    for post in posts:
+        post.refresh_from_text()
+    return posts
+
+
+def comment_key(comment):
+    return comment.post_id, comment.author_id, comment.created_at
+
+
+def build_comments(records):
+    authors = user_ids(record['author'] for record in records)
+    posts = post_ids(record['post'] for record in records)
+    built = [
+        models.Comment(
+            post_id=posts[record['post']],
+            author_id=authors[record['author']],
+            text=record['text'],
+            created_at=parse_datetime(record['created_at']),
+        )
+        for record in records
+        if record['author'] in authors and record['post'] in posts
+    ]
+    # comments have no unique column, so a batch replayed after a crash
+    # between its commit and the checkpoint is told apart by its post,
+    # author and timestamp instead
+    if not built:
+        return built
+    created = [comment.created_at for comment in built]
+    existing = set(
+        models.Comment.objects.filter(
+            post_id__in={comment.post_id for comment in built},
+            created_at__range=(min(created), max(created)),
+        ).values_list('post_id', 'author_id', 'created_at')
+    )
+    return [comment for comment in built if comment_key(comment) not in existing]
+
+
+# a row already stored under an imported natural key is the same row
+# being replayed only if these match; otherwise it's someone else, and
+# ignore_conflicts would hang the record's profile, posts or comments on it
+def user_collisions(users):
+    existing = {
+        username: (email, date_joined)
+        for username, email, date_joined in User.objects.filter(
+            username__in=[user.username for user in users]
+        ).values_list('username', 'email', 'date_joined')
+    }
+    return [
+        user.username
+        for user in users
+        if user.username in existing and existing[user.username] != (user.email, user.date_joined)
+    ]
+
+
+def post_collisions(posts):
+    existing = {
+        slug: (author_id, created_at)
+        for slug, author_id, created_at in models.Post.objects.filter(
+            slug__in=[post.slug for post in posts]
+        ).values_list('slug', 'author_id', 'created_at')
+    }
+    return [
+        post.slug
+        for post in posts
+        if post.slug in existing and existing[post.slug] != (post.author_id, post.created_at)
+    ]
+
+
+COLLISIONS = {
+    'user': user_collisions,
+    'post': post_collisions,
+}
+
+
+# record type -> (model, builder); natural keys of users, profiles and
+# posts are unique and comments are checked against the rows already
+# there, so replaying a batch after a crash skips existing rows
+IMPORTS = {
+    'user': (User, build_users),
+    'userinfo': (models.UserInfo, build_userinfos),
+    'post': (models.Post, build_posts),
+    'comment': (models.Comment, build_comments),
+}
+
+
+class Command(BaseCommand):
+    help = "Imports a directory written by export_content, in batches, resuming where it stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over")
+        parser.add_argument('--verify-media', action='store_true', help="Check media files against the manifest")
+
+    def read_checkpoint(self, path, restart):
+        if restart or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read() or 0)
+
+    def write_checkpoint(self, path, offset):
+        # rename is atomic, a crash never leaves a half written offset
+        with open(f'{path}.tmp', 'w') as checkpoint:
+            checkpoint.write(str(offset))
+        os.replace(f'{path}.tmp', path)
+
+    def flush(self, record_type, records):
+        model, build = IMPORTS[record_type]
+        with transaction.atomic():
+            objs = build(records)
+            collisions = COLLISIONS[record_type](objs) if record_type in COLLISIONS else []
+            if collisions:
+                # stop before the batch, and everything after it, is attached
+                # to the wrong rows; the checkpoint stays in front of it
+                for key in collisions:
+                    self.stderr.write(f"{record_type} {key} already exists with different data")
+                raise CommandError(
+                    f"{len(collisions)} {record_type} records collide with existing rows, "
+                    "rename or remove them and run the import again"
+                )
+            objs = model.objects.bulk_create(objs, ignore_conflicts=True)
+            if model is models.Comment:
+                # imported posts keep their exported updated_at
+                comments.recount_comments({comment.post_id for comment in objs}, touch=False)
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        content = os.path.join(directory, CONTENT_FILE)
+        checkpoint = os.path.join(directory, CHECKPOINT_FILE)
+        if not os.path.exists(content):
+            raise CommandError(f"{content} does not exist")
+
+        offset = self.read_checkpoint(checkpoint, options['restart'])
+        if offset:
+            self.stdout.write(f"resuming at byte {offset}")
+
+        imported = dict.fromkeys(IMPORTS, 0)
+        timestamps = [
+            models.Post._meta.get_field('created_at'),
+            models.Post._meta.get_field('updated_at'),
+            models.Comment._meta.get_field('created_at'),
+        ]
+
+        with open(content, 'rb') as source, preserve_timestamps(*timestamps):
+            source.seek(offset)
+            batch, batch_type = [], None
+
+            # readline keeps tell() usable, which a for loop over the file doesn't
+            for line in iter(source.readline, b''):
+                record = json.loads(line)
+                record_type = record.pop('type')
+                if record_type not in IMPORTS:
+                    raise CommandError(f"unknown record type {record_type!r} at byte {offset}")
+
+                if batch and (record_type != batch_type or len(batch) >= options['batch_size']):
+                    self.flush(batch_type, batch)
+                    imported[batch_type] += len(batch)
+                    self.write_checkpoint(checkpoint, offset)
+                    batch = []
+
+                batch.append(record)
+                batch_type = record_type
+                offset = source.tell()
+
+            if batch:
+                self.flush(batch_type, batch)
+                imported[batch_type] += len(batch)
+                self.write_checkpoint(checkpoint, offset)
+
+        # bulk_create skips the signals that keep cached pages fresh
+        caching.bump_page_version()
+
+        for record_type, count in imported.items():
+            self.stdout.write(f"{record_type}: {count} records read")
+        self.stdout.write("run dedupe_media and build_image_variants to store and render variants for imported media")
+
+        if options['verify_media']:
+            self.verify_media(os.path.join(directory, MEDIA_MANIFEST_FILE))
+
+    def verify_media(self, manifest_path):
+        problems = 0
+        with open(manifest_path, encoding='utf-8') as manifest:
+            for line in manifest:
+                entry = json.loads(line)
+                if not default_storage.exists(entry['name']):
+                    self.stderr.write(f"missing: {entry['name']}")
+                    problems += 1
+                elif default_storage.size(entry['name']) != entry['size']:
+                    self.stderr.write(f"size differs: {entry['name']}")
+                    problems += 1
+                # a file damaged in transit usually keeps its size
+                elif file_digest(entry['name']) != entry['sha256']:
+                    self.stderr.write(f"content differs: {entry['name']}")
+                    problems += 1
+        self.stdout.write(f"media check: {problems} problems")
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from general_stuff import caching
+from general_stuff import models
+from general_stuff import rendering
+
+RENDERED_FIELDS = ['text_html', 'text_hash', 'render_version']
+
+
+class Command(BaseCommand):
+    help = "Renders post bodies to HTML in parallel, for posts rendered by an older renderer version"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Rendering processes, 1 renders here")
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Check every post against its text hash, e.g. after texts were changed with update()",
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be positive")
+
+        posts = models.Post.objects.all()
+        if not options['all']:
+            posts = posts.exclude(render_version=rendering.RENDERER_VERSION)
+
+        executor = None
+        if options['workers'] > 1:
+            # spawn, like images.py: workers need rendering.py, not Django
+            executor = ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn'))
+
+        rendered = skipped = 0
+        last_pk = 0
+        try:
+            while True:
+                batch = list(
+                    posts.filter(pk__gt=last_pk).order_by('pk')
+                    .only('pk', 'text', 'text_hash', 'render_version')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                stale = [
+                    post for post in batch
+                    if post.render_version != rendering.RENDERER_VERSION
+                    or post.text_hash != rendering.text_hash(post.text)
+                ]
+                texts = [post.text for post in stale]
+                if executor:
+                    html = list(executor.map(rendering.render, texts, chunksize=max(len(texts) // options['workers'], 1)))
+                else:
+                    html = [rendering.render(text) for text in texts]
+
+                saved = self.save(stale, html)
+                rendered += saved
+                skipped += len(stale) - saved
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if rendered:
+            # bulk_update skips the signals
+            caching.bump_page_version()
+        self.stdout.write(f"{rendered} posts rendered, {skipped} edited meanwhile and left to their own save")
+
+    def save(self, posts, html):
+        with transaction.atomic():
+            # a post edited while its batch rendered already has fresh HTML
+            current = dict(
+                models.Post.objects.select_for_update()
+                .filter(pk__in=[post.pk for post in posts])
+                .values_list('pk', 'text')
+            )
+            updated = []
+            for post, body in zip(posts, html):
+                if current.get(post.pk) != post.text:
+                    continue
+                post.text_html = body
+                post.text_hash = rendering.text_hash(post.text)
+                post.render_version = rendering.RENDERER_VERSION
+                updated.append(post)
+            models.Post.objects.bulk_update(updated, RENDERED_FIELDS)
+        return len(updated)
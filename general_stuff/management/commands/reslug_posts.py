@@ -0,0 +1,59 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from general_stuff import caching
+from general_stuff import models
+from general_stuff import slugs
+
+# slugs made by the old generate_slug on a collision: "<title>-<uuid4>"
+UUID_SUFFIX_RE = re.compile(r'-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+class Command(BaseCommand):
+    help = "Replaces uuid suffixed slugs with readable ones, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help="Re-slug every post, not only uuid suffixed ones")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        changed = 0
+        last_pk = 0
+
+        while True:
+            batch = list(
+                models.Post.objects
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'title', 'slug')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            reserved = set()
+            updated = []
+            for post in batch:
+                if not options['all'] and not UUID_SUFFIX_RE.search(post.slug):
+                    continue
+
+                slug = slugs.unique_slug(post.title, exclude_pk=post.pk, reserved=reserved)
+                if slug == post.slug:
+                    continue
+
+                self.stdout.write(f"{post.slug} -> {slug}")
+                reserved.add(slug)
+                post.slug = slug
+                updated.append(post)
+
+            if updated and not options['dry_run']:
+                with transaction.atomic():
+                    models.Post.objects.bulk_update(updated, ['slug'])
+            changed += len(updated)
+
+        if changed and not options['dry_run']:
+            # bulk_update skips the signals
+            caching.bump_page_version()
+        self.stdout.write(f"{changed} posts re-slugged")
@@ -0,0 +1,37 @@
+import random
+
+from django.core.management.base import BaseCommand
+from general_stuff import seeding
+
+
+class Command(BaseCommand):
+    help = "Fills the database with generated users, profiles, posts, images and comments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments-per-post', type=int, default=3, help="Average, the actual number varies")
+        parser.add_argument('--published-ratio', type=float, default=0.9)
+        parser.add_argument('--dream-team', type=int, default=6, help="How many of the new users join the dream team")
+        parser.add_argument('--images', type=int, default=0, help="Distinct images to generate")
+        parser.add_argument('--image-ratio', type=float, default=0.3, help="Share of posts with an image")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, help="Repeatable data for the same seed")
+
+    def handle(self, *args, **options):
+        created = seeding.seed(
+            users=options['users'],
+            posts=options['posts'],
+            comments_per_post=options['comments_per_post'],
+            published_ratio=options['published_ratio'],
+            dream_team=options['dream_team'],
+            images=options['images'],
+            image_ratio=options['image_ratio'],
+            batch_size=options['batch_size'],
+            rng=random.Random(options['random_seed']),
+        )
+
+        for name, count in created.items():
+            self.stdout.write(f"{name}: {count} created")
+        if created['images']:
+            self.stdout.write("run build_image_variants to render variants for the seeded images")
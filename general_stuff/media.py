@@ -0,0 +1,216 @@
+import hashlib
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from . import images
+from . import models
+
+# Uploads are stored once per content, as blobs/<ab>/<cd>/<sha256><ext>.
+# MediaBlob.refs counts the rows whose file field holds a blob: signals
+# move it as images and avatars are set, replaced and deleted, and a blob
+# nothing points at any more is deleted from disk.
+BLOB_DIR = 'blobs'
+# named after their source blob and cleaned up by images.py, stored as is
+PLAIN_DIRS = (images.VARIANTS_DIR,)
+# an unreferenced blob younger than this may be an upload whose row is
+# still being saved, it's left for a later collect()
+COLLECT_AFTER = timedelta(hours=1)
+CHUNK_SIZE = 64 * 1024
+
+# (model, file field, variants manifest field) of every field holding blobs
+REFERENCES = (
+    (models.Post, 'image', 'image_variants'),
+    (models.UserInfo, 'avatar', 'avatar_variants'),
+)
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+
+def is_plain(name):
+    return name.startswith(tuple(f'{directory}/' for directory in PLAIN_DIRS))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload under the hash of its content, saving a file that
+    is already stored writes nothing and returns the stored name. Blobs
+    are shared, so delete() leaves them to collect().
+    """
+    def get_available_name(self, name, max_length=None):
+        if is_plain(name):
+            return super().get_available_name(name, max_length)
+        # only the extension is kept, _save picks the name
+        return name
+
+    def _save(self, name, content):
+        if is_plain(name):
+            return super()._save(name, content)
+
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        # the digest is known once the last chunk is written, so the upload
+        # goes to a temporary file next to the blobs and is renamed into place
+        temporary = os.path.join(directory, f'.upload-{get_random_string(12)}')
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temporary, 'xb') as handle:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    handle.write(chunk)
+
+            stored = blob_name(digest.hexdigest(), os.path.splitext(name)[1].lower())
+            target = self.path(stored)
+            if os.path.exists(target):
+                os.remove(temporary)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, target)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+        models.MediaBlob.objects.update_or_create(name=stored, defaults={'size': size})
+        return stored
+
+    def delete(self, name):
+        if not is_blob(name):
+            super().delete(name)
+
+    def delete_blob(self, name):
+        super().delete(name)
+
+
+def _fields(model):
+    return [field for referencing, field, _ in REFERENCES if referencing is model]
+
+
+def _name(value):
+    return getattr(value, 'name', value) or None
+
+
+def remember(instance):
+    # the names as loaded, deferred fields are left out
+    instance._media_names = {
+        field: _name(instance.__dict__[field]) for field in _fields(type(instance)) if field in instance.__dict__
+    }
+
+
+def track(instance, created, update_fields=None):
+    """
+    Moves the reference counts after `instance` was saved: a blob it now
+    holds gains one, the blob it held before loses one.
+    """
+    known = instance.__dict__.setdefault('_media_names', {})
+    for field in _fields(type(instance)):
+        if field not in instance.__dict__ or (update_fields is not None and field not in update_fields):
+            continue
+        name = _name(getattr(instance, field))
+        if created:
+            old = None
+        elif field in known:
+            old = known[field]
+        else:
+            # loaded deferred and assigned since, count from the rows
+            recount([name])
+            known[field] = name
+            continue
+
+        if name != old:
+            if is_blob(name):
+                models.MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+            release(old)
+        known[field] = name
+
+
+def forget(instance):
+    # after `instance` was deleted
+    known = instance.__dict__.get('_media_names', {})
+    for field in _fields(type(instance)):
+        release(known.get(field, _name(instance.__dict__.get(field))))
+
+
+def release(name):
+    if not is_blob(name):
+        return
+    models.MediaBlob.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+    collect([name])
+
+
+def count_refs(names=None):
+    counts = Counter()
+    for model, field, _ in REFERENCES:
+        rows = model._default_manager.filter(**{f'{field}__startswith': f'{BLOB_DIR}/'})
+        if names is not None:
+            rows = rows.filter(**{f'{field}__in': names})
+        for name, refs in rows.order_by().values_list(field).annotate(refs=Count('pk')):
+            counts[name] += refs
+    return counts
+
+
+def recount(names=None):
+    """
+    Sets refs from the rows themselves, for bulk paths that skip the
+    signals, e.g. seeding and import_content. All blobs without `names`.
+    """
+    names = [name for name in names if is_blob(name)] if names is not None else None
+    counts = count_refs(names)
+    blobs = models.MediaBlob.objects.all()
+    if names is not None:
+        blobs = blobs.filter(name__in=names)
+
+    changed = []
+    for blob in blobs.only('pk', 'name', 'refs').iterator(chunk_size=1000):
+        if blob.refs != counts[blob.name]:
+            blob.refs = counts[blob.name]
+            changed.append(blob)
+    models.MediaBlob.objects.bulk_update(changed, ['refs'], batch_size=1000)
+    return counts
+
+
+def collect(names=None, verify=True, storage=default_storage):
+    """
+    Deletes the blobs with no references that weren't uploaded within
+    COLLECT_AFTER. `verify` counts the references of each from the rows
+    first, a drifted counter must not delete a file still in use.
+    """
+    unused = models.MediaBlob.objects.filter(refs=0, touched_at__lt=timezone.now() - COLLECT_AFTER)
+    if names is not None:
+        unused = unused.filter(name__in=names)
+    candidates = list(unused.values_list('name', flat=True))
+    if verify and candidates:
+        in_use = count_refs(candidates)
+        for name in in_use:
+            models.MediaBlob.objects.filter(name=name).update(refs=in_use[name])
+        candidates = [name for name in candidates if not in_use[name]]
+
+    removed = []
+    for name in candidates:
+        # the same conditions again, the row may have been reused meanwhile
+        deleted, _ = unused.filter(name=name).delete()
+        if deleted:
+            removed.append(name)
+            transaction.on_commit(lambda name=name: _delete_file(storage, name))
+    return removed
+
+
+def _delete_file(storage, name):
+    # uploaded again since, the file is back in use
+    if not models.MediaBlob.objects.filter(name=name).exists():
+        storage.delete_blob(name)
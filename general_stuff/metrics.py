@@ -0,0 +1,186 @@
+import bisect
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+from django.template.backends.django import DjangoTemplates, Template
+
+# Per-request timings and per-view histograms in Prometheus text format.
+# Everything is kept in process memory: recording a request costs a few
+# perf_counter() calls and one short lock. Each worker process exposes its
+# own numbers, Prometheus sums them when every worker is scraped.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('general_stuff_request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Collects where a request spends its time. record_query reports the
+    SQL part, TimedTemplate the rendering.
+    """
+    __slots__ = ('queries', 'sql', 'template', 'rendering')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self, total):
+        view = max(total - self.sql - self.template, 0)
+        return (
+            f'db;dur={self.sql * 1000:.2f};desc="{self.queries} queries", '
+            f'tpl;dur={self.template * 1000:.2f}, '
+            f'view;dur={view * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    # found through the context variable, so queries that async views run
+    # in sync_to_async threads are counted for the right request
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def install(connection):
+    # connection_created fires again on reconnect, wrap only once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        # includes render through the same backend, count the outer one only
+        if timings is None or timings.rendering:
+            return super().render(context, request)
+
+        timings.rendering = True
+        start, sql = time.perf_counter(), timings.sql
+        try:
+            return super().render(context, request)
+        finally:
+            # lazy querysets run while rendering, they are counted as SQL
+            timings.template += time.perf_counter() - start - (timings.sql - sql)
+            timings.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report their render time."""
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # bisect_left: a value equal to a bound belongs to that bucket (le)
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Registry:
+    HISTOGRAMS = (
+        ('website_request_duration_seconds', 'Time from the first middleware to the response', DURATION_BUCKETS),
+        ('website_db_duration_seconds', 'Time spent in SQL per request', DURATION_BUCKETS),
+        ('website_db_queries', 'SQL queries per request', QUERY_COUNT_BUCKETS),
+        ('website_template_duration_seconds', 'Time spent rendering templates per request', DURATION_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms = {}
+        self._responses = {}
+
+    def observe(self, view, status, timings, total):
+        values = (total, timings.sql, timings.queries, timings.template)
+        status_class = f'{status // 100}xx'
+
+        with self._lock:
+            histograms = self._histograms.get(view)
+            if histograms is None:
+                histograms = self._histograms[view] = [Histogram(buckets) for _, _, buckets in self.HISTOGRAMS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+            key = (view, status_class)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def render(self):
+        with self._lock:
+            histograms = {view: [(h.counts[:], h.sum, h.count) for h in hs] for view, hs in self._histograms.items()}
+            responses = dict(self._responses)
+
+        lines = [
+            '# HELP website_responses_total Responses by view and status class',
+            '# TYPE website_responses_total counter',
+        ]
+        for (view, status_class), count in sorted(responses.items()):
+            lines.append(f'website_responses_total{{view="{_label(view)}",status="{status_class}"}} {count}')
+
+        for i, (name, help_text, buckets) in enumerate(self.HISTOGRAMS):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for view, observed in sorted(histograms.items()):
+                counts, total, count = observed[i]
+                label = f'view="{_label(view)}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{{label}}} {total}')
+                lines.append(f'{name}_count{{{label}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._responses.clear()
+
+
+registry = Registry()
+
+
+def view_label(request):
+    # route names keep the label set small, raw paths would not
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
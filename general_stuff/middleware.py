@@ -0,0 +1,59 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import metrics
+
+
+class PerformanceMiddleware:
+    """
+    Times every request and splits it into SQL, template rendering and
+    the rest (the view body and the other middleware). The split goes to
+    the client in a Server-Timing header and into the per-view histograms
+    behind /metrics. Keep it first in MIDDLEWARE so the total covers the
+    whole stack.
+
+    The header tells how much SQL a page runs, so it only goes to staff,
+    or to everyone with DEBUG or SERVER_TIMING_PUBLIC on.
+    """
+    sync_capable = True
+    # under ASGI a sync-only middleware would push the async views into a thread
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        total = time.perf_counter() - start
+        # requests answered before AuthenticationMiddleware have no user
+        user = getattr(request, 'user', None)
+        return self.record(request, response, timings, total, user is not None and user.is_staff)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        total = time.perf_counter() - start
+        # the lazy request.user would query the database on the event loop
+        user = await request.auser() if hasattr(request, 'auser') else None
+        return self.record(request, response, timings, total, user is not None and user.is_staff)
+
+    def record(self, request, response, timings, total, staff):
+        metrics.registry.observe(metrics.view_label(request), response.status_code, timings, total)
+        if staff or settings.DEBUG or settings.SERVER_TIMING_PUBLIC:
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
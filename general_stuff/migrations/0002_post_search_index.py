@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Must match the vector built in general_stuff.search._search_postgres,
+# otherwise the planner won't use the index.
+CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS general_stuff_post_search_gin
+ON general_stuff_post USING gin ((
+    setweight(to_tsvector('russian'::regconfig, COALESCE(title, '')), 'A')
+    || setweight(to_tsvector('russian'::regconfig, COALESCE(text, '')), 'B')
+))
+"""
+
+DROP_INDEX = "DROP INDEX IF EXISTS general_stuff_post_search_gin"
+
+
+def create_search_index(apps, schema_editor):
+    # other backends fall back to the in-process index from search.py
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general_stuff', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
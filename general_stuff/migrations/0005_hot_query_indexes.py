@@ -0,0 +1,46 @@
+# Generated by Django 5.0 on 2026-10-18 18:19
+
+from django.conf import settings
+from django.db import migrations, models
+from general_stuff.db.operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently, see general_stuff/db/operations.py
+    atomic = False
+
+    dependencies = [
+        ('general_stuff', '0004_comments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ('-created_at', '-id'), 'verbose_name': 'Пост', 'verbose_name_plural': 'Посты'},
+        ),
+        RemoveIndexConcurrently(
+            model_name='comment',
+            name='comment_post_created_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at', '-id'], name='post_published_feed_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_feed_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['updated_at'], name='post_published_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='userinfo',
+            index=models.Index(condition=models.Q(('dream_team', True)), fields=['phone_number'], name='userinfo_dream_team_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general_stuff', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='short_excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-18 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+from general_stuff.db.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently, see general_stuff/db/operations.py
+    atomic = False
+
+    dependencies = [
+        ('general_stuff', '0007_post_text_html'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['author', '-created_at', '-id'], name='post_author_feed_idx'),
+        ),
+    ]
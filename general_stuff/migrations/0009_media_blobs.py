@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('general_stuff', '0008_post_author_feed_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('touched_at', models.DateTimeField(auto_now=True, verbose_name='Загружен')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+                'indexes': [models.Index(condition=models.Q(('refs', 0)), fields=['touched_at'], name='mediablob_unused_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0 on 2026-10-18 19:40
+
+from django.conf import settings
+from django.db import migrations, models
+from general_stuff.db.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently, see general_stuff/db/operations.py
+    atomic = False
+
+    dependencies = [
+        ('general_stuff', '0010_post_image_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(fields=['created_at'], name='comment_created_idx'),
+        ),
+    ]
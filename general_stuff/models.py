@@ -1,7 +1,24 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.shortcuts import reverse
+from django.utils.text import Truncator
 from phonenumber_field.modelfields import PhoneNumberField
+from . import rendering
+
+
+# (words, characters) the lists cut a post's text to, in the order of the
+# truncatewords|truncatechars filters the templates used to apply
+EXCERPT_LENGTH = (50, 300)
+SHORT_EXCERPT_LENGTH = (10, 50)
+
+
+# filled in from Post.text by Post.refresh_from_text
+TEXT_DERIVED_FIELDS = ('excerpt', 'short_excerpt', 'text_html', 'text_hash', 'render_version')
+
+
+def excerpt(text, length):
+    words, chars = length
+    return Truncator(Truncator(text).words(words, truncate=' …')).chars(chars)
 
 
 # Create your models here.
@@ -30,6 +47,8 @@ class UserInfo(models.Model):
         blank=True, null=True,
         upload_to='avatars', verbose_name="Аватарка"
     )
+    # resized copies of the avatar, see images.py
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     dream_team = models.BooleanField(blank=True, default=False)
 
     def __str__(self):
@@ -42,6 +61,14 @@ class UserInfo(models.Model):
         verbose_name = "Доп. инфо"
         verbose_name_plural="Доп. инфо"
         ordering = ("phone_number", )
+        indexes = [
+            # the sidebar: dream team members in phone number order
+            models.Index(
+                fields=["phone_number"],
+                condition=models.Q(dream_team=True),
+                name="userinfo_dream_team_idx",
+            ),
+        ]
 
 
 class Post(models.Model):
@@ -51,11 +78,25 @@ class Post(models.Model):
 
     text = models.TextField(verbose_name="Текст")
 
+    # the text as the home page and the staff list show it, lists load
+    # these with .defer('text') instead of the whole body
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH[1], blank=True, editable=False)
+    short_excerpt = models.CharField(max_length=SHORT_EXCERPT_LENGTH[1], blank=True, editable=False)
+
+    # the text rendered by general_stuff.rendering, with the hash of the
+    # text and the renderer version it was made from
+    text_html = models.TextField(blank=True, editable=False)
+    text_hash = models.CharField(max_length=64, blank=True, editable=False)
+    render_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
     image = models.ImageField(
         blank=True, null=True,
         upload_to="posts_images",
         verbose_name="Фото к посту")
 
+    # resized copies of the image, see images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name="Время создания"
@@ -66,6 +107,9 @@ class Post(models.Model):
 
     is_published = models.BooleanField(default=False, verbose_name="Опубликовать")
 
+    # maintained by general_stuff.comments, never counted per request
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Комментарии")
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -78,18 +122,75 @@ class Post(models.Model):
     def get_absolute_url(self):
         return reverse('post-detail', kwargs={'slug': self.slug})
 
+    def refresh_excerpts(self):
+        self.excerpt = excerpt(self.text, EXCERPT_LENGTH)
+        self.short_excerpt = excerpt(self.text, SHORT_EXCERPT_LENGTH)
+
+    def refresh_html(self):
+        # only when the text or the renderer changed, a save that leaves
+        # the text alone costs a hash, not a render
+        digest = rendering.text_hash(self.text)
+        if digest != self.text_hash or self.render_version != rendering.RENDERER_VERSION:
+            self.text_html = rendering.render(self.text)
+            self.text_hash = digest
+            self.render_version = rendering.RENDERER_VERSION
+
+    def refresh_from_text(self):
+        # save() calls it, bulk_create callers have to themselves
+        self.refresh_excerpts()
+        self.refresh_html()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            # a post loaded without its text keeps what was derived from it
+            if 'text' not in self.get_deferred_fields():
+                self.refresh_from_text()
+        elif 'text' in update_fields:
+            self.refresh_from_text()
+            kwargs['update_fields'] = {*update_fields, *TEXT_DERIVED_FIELDS}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
-        ordering = ("-created_at", "title", "author")
+        # the same order the keyset paginator walks, so one index serves
+        # the feeds, the staff list and the admin
+        ordering = ("-created_at", "-id")
+        indexes = [
+            # home page and load-more, drafts never enter the index
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(is_published=True),
+                name="post_published_feed_idx",
+            ),
+            # an author's published posts on the profile page
+            models.Index(
+                fields=["author", "-created_at", "-id"],
+                condition=models.Q(is_published=True),
+                name="post_author_feed_idx",
+            ),
+            # who may see an upload, see serving.media_owners
+            models.Index(fields=["image"], name="post_image_idx"),
+            # staff list of all posts, drafts included
+            models.Index(fields=["-created_at", "-id"], name="post_feed_idx"),
+            # newest published change for the conditional GET validators
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(is_published=True),
+                name="post_published_updated_idx",
+            ),
+        ]
 
 
 class Comment(models.Model):
     text = models.TextField(verbose_name="Текст комментария")
 
+    # the (post, created_at, id) index below covers lookups by post
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name="Комментарий принадлежит этому посту"
     )
 
@@ -99,16 +200,27 @@ class Comment(models.Model):
         verbose_name="Автор"
     )
 
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Время создания"
+    )
+
     def __str__(self):
         return f"{self.text}"
 
     def get_absolute_url(self):
-        return reverse('post-detail', kwargs={'post': self.post.slug})
+        return reverse('post-detail', kwargs={'slug': self.post.slug})
 
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
-        ordering = ("post", "author")
+        ordering = ("post", "created_at")
+        indexes = [
+            # a page of comments is WHERE post_id = ... ORDER BY created_at, id
+            models.Index(fields=["post", "created_at", "id"], name="comment_post_created_idx"),
+            # the admin's date_hierarchy
+            models.Index(fields=["created_at"], name="comment_created_idx"),
+        ]
 
 
 class Tagline(models.Model):
@@ -121,3 +233,24 @@ class Tagline(models.Model):
     class Meta:
         verbose_name = "Девиз"
         verbose_name_plural = "Девиз"
+
+
+class MediaBlob(models.Model):
+    # a file of the content-addressed media storage, see media.py
+    name = models.CharField(max_length=255, unique=True, verbose_name="Файл")
+    size = models.PositiveBigIntegerField(verbose_name="Размер")
+    # rows whose image or avatar is this file
+    refs = models.PositiveIntegerField(default=0, verbose_name="Ссылок")
+    # last upload of this content, a fresh blob may be waiting for its row
+    touched_at = models.DateTimeField(auto_now=True, verbose_name="Загружен")
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Медиафайл"
+        verbose_name_plural = "Медиафайлы"
+        indexes = [
+            # the garbage collector's candidates
+            models.Index(fields=["touched_at"], condition=models.Q(refs=0), name="mediablob_unused_idx"),
+        ]
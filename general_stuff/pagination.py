@@ -0,0 +1,199 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a unique ordering, e.g. ('-created_at', '-id').
+
+    Instead of OFFSET every page seeks past the last row of the previous
+    one with a WHERE clause on the ordering columns, so page N costs the
+    same as the first page. Cursors are opaque urlsafe strings.
+    """
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+
+    def key(self, obj):
+        if isinstance(obj, dict):
+            return tuple(obj[field] for field in self.fields)
+        return tuple(getattr(obj, field) for field in self.fields)
+
+    def encode_cursor(self, obj):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in self.key(obj)
+        ]
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+
+        opts = self.queryset.model._meta
+        try:
+            return tuple(
+                opts.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            )
+        except ValidationError:
+            raise InvalidCursor(cursor)
+
+    def _seek(self, values, forward):
+        # (a, b) after (x, y) in ('-a', '-b') order means
+        # a < x OR (a = x AND b < y), generalised for any number of columns
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            name = self.fields[i]
+            descending = field.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+
+            condition = Q(**{f'{name}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(self.fields[:i], values[:i]):
+                condition &= Q(**{prev_name: prev_value})
+            conditions.append(condition)
+
+        # the OR can't bound an index range by itself; the redundant bound
+        # on the leading column lets the scan start at the cursor instead
+        # of walking every row of the previous pages
+        descending = self.ordering[0].startswith('-')
+        lookup = 'lte' if descending == forward else 'gte'
+        return Q(**{f'{self.fields[0]}__{lookup}': values[0]}) & reduce(or_, conditions)
+
+    def _reversed_ordering(self):
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    def _query(self, after, before):
+        if before:
+            values = self.decode_cursor(before)
+            return (
+                self.queryset
+                .filter(self._seek(values, forward=False))
+                .order_by(*self._reversed_ordering())[:self.per_page + 1]
+            )
+
+        queryset = self.queryset
+        if after:
+            queryset = queryset.filter(self._seek(self.decode_cursor(after), forward=True))
+        return queryset.order_by(*self.ordering)[:self.per_page + 1]
+
+    def _page(self, rows, after, before):
+        if before:
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after)
+
+        if not rows:
+            return KeysetPage([])
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0]) if has_previous else None,
+        )
+
+    def get_page(self, after=None, before=None):
+        """
+        Page that follows the `after` cursor or precedes the `before`
+        cursor. Without cursors it's the first page.
+        """
+        return self._page(list(self._query(after, before)), after, before)
+
+    async def aget_page(self, after=None, before=None):
+        return self._page([row async for row in self._query(after, before)], after, before)
+
+
+def estimated_rows(model, using='default'):
+    """
+    The planner's row count for `model`'s table, from the statistics
+    ANALYZE gathers. None where there are none.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # -1 before the first ANALYZE
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # one row per index, each starting with the rows it covers;
+            # partial indexes cover fewer
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+            return max(counts, default=None)
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    For admin changelists over big tables, where COUNT(*) reads the whole
+    table on every page. An unfiltered list takes the planner's estimate,
+    a filtered one is counted up to `count_limit` rows and stops there.
+    """
+    count_limit = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset.order_by()[:self.count_limit].count()
@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from . import models
+
+PROFILE_PAGE_SIZE = 10
+# signals drop a block on every change to it, the timeout only bounds
+# staleness after bulk imports, which send none
+PROFILE_BLOCK_TIMEOUT = 60 * 60
+
+
+def author_posts(author):
+    # post_author_feed_idx, in the order KeysetPaginator walks it
+    return models.Post.objects.filter(author=author, is_published=True).defer('text')
+
+
+def profile_block_key(user_id, is_owner):
+    return f'general_stuff:profile-block:{user_id}:{int(is_owner)}'
+
+
+def forget_profile_block(user_id):
+    cache.delete_many([profile_block_key(user_id, is_owner) for is_owner in (False, True)])
+
+
+def profile_block(author, is_owner):
+    """
+    The rendered cards of the profile page: avatar, contacts, details and
+    the number of published posts. `author` comes with userinfo joined.
+    """
+    key = profile_block_key(author.pk, is_owner)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('general_stuff/profile_block.html', {
+            'main_data': author,
+            # accounts made in the admin have no profile row
+            'rest_data': getattr(author, 'userinfo', None),
+            'published': author_posts(author).count(),
+            'is_owner': is_owner,
+        })
+        cache.set(key, html, PROFILE_BLOCK_TIMEOUT)
+    return html
@@ -0,0 +1,41 @@
+import hashlib
+
+import markdown
+import nh3
+
+# Post bodies are Markdown, rendered to HTML once when the text changes and
+# stored on the post, see Post.refresh_html. Bump RENDERER_VERSION whenever
+# the output for the same text changes (extensions, sanitizer rules) and
+# run `manage.py render_posts` to bring stored HTML up to date.
+RENDERER_VERSION = 1
+
+# nl2br: posts written before Markdown relied on white-space: pre-wrap
+EXTENSIONS = ('fenced_code', 'sane_lists', 'nl2br')
+
+LINK_REL = 'nofollow noopener noreferrer'
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _keep_language_class(tag, attribute, value):
+    # fenced_code marks blocks with class="language-<name>", nothing else
+    # gets to pick a class from the stylesheet
+    if attribute == 'class':
+        return value if tag == 'code' and value.startswith('language-') and ' ' not in value else None
+    return value
+
+
+def render(text):
+    """
+    Markdown to sanitized HTML. Free of Django, so render_posts can run
+    it in worker processes.
+    """
+    html = markdown.markdown(text, extensions=EXTENSIONS, output_format='html')
+    return nh3.clean(
+        html,
+        attributes={**nh3.ALLOWED_ATTRIBUTES, 'code': {'class'}},
+        attribute_filter=_keep_language_class,
+        link_rel=LINK_REL,
+    )
@@ -0,0 +1,280 @@
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from threading import Lock
+
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import caching
+from . import models
+
+# the same expression is indexed by migration 0002, keep them in sync
+SEARCH_CONFIG = 'russian'
+TITLE_WEIGHT = 'A'
+TEXT_WEIGHT = 'B'
+
+SNIPPET_WORDS = 35
+
+# private-use characters, they never show up in posts, so the headline can
+# be escaped safely before the <mark> tags are put back
+_START_SEL = '\ue000'
+_STOP_SEL = '\ue001'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# endings are checked longest first, a stem keeps at least three letters
+_RUSSIAN_ENDINGS = sorted((
+    'ировать', 'ость', 'ости', 'остью', 'ение', 'ения', 'ению', 'ением', 'ении',
+    'ание', 'ания', 'анию', 'анием', 'ании', 'ться', 'тся', 'ешь', 'ете', 'ите',
+    'ует', 'уют', 'ают', 'яют', 'ать', 'ять', 'ить', 'еть', 'ыть', 'ал', 'ала',
+    'али', 'ало', 'ил', 'ила', 'или', 'ило', 'ый', 'ий', 'ой', 'ая', 'яя', 'ое',
+    'ее', 'ые', 'ие', 'ого', 'его', 'ому', 'ему', 'ым', 'им', 'ых', 'их', 'ыми',
+    'ими', 'ую', 'юю', 'ами', 'ями', 'ах', 'ях', 'ам', 'ям', 'ов', 'ев', 'ей',
+    'ом', 'ем', 'ью', 'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+), key=len, reverse=True)
+_ENGLISH_ENDINGS = ('ing', 'ies', 'ed', 'es', 's')
+
+
+# the vocabulary is small compared to the number of words indexed
+@lru_cache(maxsize=100_000)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    endings = _ENGLISH_ENDINGS if word.isascii() else _RUSSIAN_ENDINGS
+
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in _WORD_RE.findall(text or '')]
+
+
+def highlight(text, terms, size=SNIPPET_WORDS):
+    # python counterpart of ts_headline, used by the in-process index
+    words = (text or '').split()
+    hits = [i for i, word in enumerate(words) if any(stem(t) in terms for t in _WORD_RE.findall(word))]
+    start = max(hits[0] - size // 3, 0) if hits else 0
+
+    parts = []
+    for word in words[start:start + size]:
+        if any(stem(t) in terms for t in _WORD_RE.findall(word)):
+            parts.append(f'<mark>{escape(word)}</mark>')
+        else:
+            parts.append(escape(word))
+
+    snippet = ' '.join(parts)
+    if start:
+        snippet = '… ' + snippet
+    if start + size < len(words):
+        snippet += ' …'
+    return mark_safe(snippet)
+
+
+class InvertedIndex:
+    """
+    In-process full-text index for databases without tsvector support.
+
+    The index is rebuilt lazily when the posts table changes, which is
+    detected with a single aggregate query per search. Saves and deletes
+    move the count or the newest updated_at, and every post change bumps
+    the page version: code that edits posts with .update() bumps it too,
+    like images.py and import_content do.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._signature = None
+        self._postings = {}
+        self._documents = {}
+
+    def refresh(self):
+        signature = (
+            caching.page_version(),
+            models.Post.objects.aggregate(total=Count('id'), changed=Max('updated_at')),
+        )
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return
+
+            postings = defaultdict(dict)
+            documents = {}
+            rows = models.Post.objects.values_list(
+                'id', 'title', 'text', 'is_published', 'created_at'
+            ).order_by()
+
+            for pk, title, text, is_published, created_at in rows.iterator(chunk_size=2000):
+                weights = defaultdict(float)
+                for term in tokenize(title):
+                    weights[term] += 1.0
+                text_terms = tokenize(text)
+                for term in text_terms:
+                    weights[term] += 0.4
+                for term, weight in weights.items():
+                    postings[term][pk] = weight
+                documents[pk] = (is_published, created_at, len(text_terms) + 1)
+
+            self._postings = dict(postings)
+            self._documents = documents
+            self._signature = signature
+
+    def search(self, term, published_only=True):
+        self.refresh()
+
+        terms = set(tokenize(term))
+        if not terms:
+            return []
+
+        postings, documents = self._postings, self._documents
+        matches = None
+        for word in terms:
+            ids = postings.get(word, {}).keys()
+            matches = set(ids) if matches is None else matches & ids
+            if not matches:
+                return []
+
+        if published_only:
+            matches = {pk for pk in matches if documents[pk][0]}
+
+        total = len(documents)
+        idf = {word: math.log(1 + total / len(postings[word])) for word in terms}
+
+        scored = []
+        for pk in matches:
+            length = documents[pk][2]
+            rank = sum(postings[word][pk] * idf[word] for word in terms) / math.log(2 + length)
+            scored.append((rank, documents[pk][1], pk))
+
+        scored.sort(reverse=True)
+        return [(pk, rank) for rank, _, pk in scored]
+
+
+_index = InvertedIndex()
+
+
+class IndexedResults:
+    """
+    Sliceable result set for the in-process index, so it can be handed to
+    a Paginator just like a queryset. Only the requested page is fetched.
+    """
+    def __init__(self, matches, term):
+        self.matches = matches
+        self.terms = set(tokenize(term))
+
+    def count(self):
+        return len(self.matches)
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+
+        page = self.matches[key]
+        posts = models.Post.objects.select_related('author').in_bulk([pk for pk, _ in page])
+
+        results = []
+        for pk, rank in page:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.rank = rank
+            post.headline = highlight(post.text, self.terms)
+            results.append(post)
+        return results
+
+
+def _postgres_document(term):
+    from django.contrib.postgres.search import SearchQuery, SearchVector
+
+    vector = (
+        SearchVector('title', config=SEARCH_CONFIG, weight=TITLE_WEIGHT)
+        + SearchVector('text', config=SEARCH_CONFIG, weight=TEXT_WEIGHT)
+    )
+    return vector, SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def _search_postgres(term, published_only):
+    from django.contrib.postgres.search import SearchHeadline, SearchRank
+
+    vector, query = _postgres_document(term)
+
+    posts = models.Post.objects.select_related('author')
+    if published_only:
+        posts = posts.filter(is_published=True)
+
+    return (
+        posts
+        .alias(document=vector)
+        .filter(document=query)
+        .annotate(
+            rank=SearchRank(vector, query),
+            raw_headline=SearchHeadline(
+                'text', query,
+                config=SEARCH_CONFIG,
+                start_sel=_START_SEL,
+                stop_sel=_STOP_SEL,
+                max_words=SNIPPET_WORDS,
+                min_words=SNIPPET_WORDS // 2,
+                max_fragments=2,
+                fragment_delimiter=' … ',
+            ),
+        )
+        .order_by('-rank', '-created_at', '-id')
+    )
+
+
+class PostgresResults:
+    """
+    Wraps the ranked queryset: Paginator counts it with one COUNT query
+    and every page is a single LIMIT/OFFSET query with headlines.
+    """
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        results = list(self.queryset[key]) if isinstance(key, slice) else [self.queryset[key]]
+
+        for post in results:
+            headline = escape(post.raw_headline)
+            post.headline = mark_safe(
+                headline.replace(_START_SEL, '<mark>').replace(_STOP_SEL, '</mark>')
+            )
+        return results if isinstance(key, slice) else results[0]
+
+
+def search_posts(term, published_only=True):
+    """
+    Returns ranked posts matching `term`. Every post in a sliced page gets
+    `rank` and an escaped `headline` snippet with matches in <mark> tags.
+    """
+    if connection.vendor == 'postgresql':
+        return PostgresResults(_search_postgres(term, published_only))
+
+    return IndexedResults(_index.search(term, published_only), term)
+
+
+def matching_posts(term):
+    """
+    Ids of every post matching `term`, drafts included, unranked, as a
+    subquery on the GIN index. None without PostgreSQL: the in-process
+    index holds every post in memory and is only built for the site search.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    vector, query = _postgres_document(term)
+    return models.Post.objects.alias(document=vector).filter(document=query).values('pk')
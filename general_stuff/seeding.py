@@ -0,0 +1,144 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image
+
+from . import caching
+from . import media
+from . import models
+from .bulk import batched, preserve_timestamps
+
+# Generates realistic volumes of users, posts and comments for query plan
+# checks and benchmarks. Rows go in through bulk_create, in batches, so a
+# million posts don't need a million round trips or a million objects in
+# memory.
+
+WORDS = (
+    'дождь', 'музыка', 'город', 'ночь', 'код', 'команда', 'лето', 'дорога',
+    'окно', 'песня', 'ветер', 'море', 'свет', 'книга', 'утро', 'голос',
+    'память', 'небо', 'улица', 'огонь', 'время', 'поезд', 'снег', 'кофе',
+)
+SEED_PERIOD = timedelta(days=3 * 365)
+# anything other than a hash is an unusable password, and costs no hashing
+UNUSABLE_PASSWORD = '!'
+SEED_IMAGE_SIZE = (1280, 720)
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed_images(run, count, rng):
+    """
+    Saves `count` distinct gradient JPEGs and returns their names. Posts
+    share them, a million posts don't need a million files.
+    """
+    upload_to = models.Post._meta.get_field('image').upload_to
+    names = []
+    for i in range(count):
+        start = [rng.randrange(256) for _ in range(3)]
+        end = [rng.randrange(256) for _ in range(3)]
+        gradient = Image.linear_gradient('L').resize(SEED_IMAGE_SIZE)
+        image = Image.merge('RGB', [
+            gradient.point(lambda v, a=a, b=b: a + (b - a) * v // 255) for a, b in zip(start, end)
+        ])
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        names.append(default_storage.save(f'{upload_to}/{run}-{i}.jpg', ContentFile(buffer.getvalue())))
+    return names
+
+
+def seed_users(run, count, dream_team, batch_size):
+    created = []
+    for batch in batched(range(count), batch_size):
+        users = User.objects.bulk_create(
+            User(username=f'{run}-user-{i}', email=f'{run}-user-{i}@example.com', password=UNUSABLE_PASSWORD)
+            for i in batch
+        )
+        models.UserInfo.objects.bulk_create(
+            models.UserInfo(user=user, status=f'status {i}', dream_team=i < dream_team)
+            for i, user in zip(batch, users)
+        )
+        created.extend(user.pk for user in users)
+    return created
+
+
+def seed_posts(run, count, author_ids, comments_per_post, published_ratio, images, image_ratio, batch_size, rng):
+    now = timezone.now()
+    posts_created = comments_created = 0
+
+    for batch in batched(range(count), batch_size):
+        posts = []
+        for i in batch:
+            created_at = now - SEED_PERIOD * rng.random()
+            post = models.Post(
+                title=words(rng, 4)[:50],
+                slug=f'{run}-{i}',
+                text=words(rng, rng.randint(40, 400)),
+                is_published=rng.random() < published_ratio,
+                author_id=rng.choice(author_ids),
+                image=rng.choice(images) if images and rng.random() < image_ratio else None,
+                created_at=created_at,
+                updated_at=created_at,
+                comment_count=rng.randint(0, 2 * comments_per_post),
+            )
+            # bulk_create skips save()
+            post.refresh_from_text()
+            posts.append(post)
+        posts = models.Post.objects.bulk_create(posts)
+
+        # counters were set up front, so no recount is needed afterwards
+        comments = (
+            models.Comment(
+                post_id=post.pk,
+                author_id=rng.choice(author_ids),
+                text=words(rng, rng.randint(5, 40)),
+                created_at=post.created_at + timedelta(minutes=rng.randint(1, 60 * 24 * 30)),
+            )
+            for post in posts
+            for _ in range(post.comment_count)
+        )
+        for comment_batch in batched(comments, batch_size):
+            models.Comment.objects.bulk_create(comment_batch)
+            comments_created += len(comment_batch)
+
+        posts_created += len(posts)
+    return posts_created, comments_created
+
+
+def seed(
+    users=100, posts=1000, comments_per_post=3, published_ratio=0.9, dream_team=6,
+    images=0, image_ratio=0.3, batch_size=5000, rng=None,
+):
+    """
+    Adds `users` users with profiles and `posts` posts with about
+    `comments_per_post` comments each; `image_ratio` of the posts get one
+    of `images` generated pictures. Every call uses a new run prefix, so
+    seeding twice adds rows instead of failing on unique slugs.
+    """
+    rng = rng or random.Random()
+    run = f'seed{timezone.now():%Y%m%d%H%M%S}{rng.randrange(1000):03}'
+    timestamps = [
+        models.Post._meta.get_field('created_at'),
+        models.Post._meta.get_field('updated_at'),
+        models.Comment._meta.get_field('created_at'),
+    ]
+
+    image_names = seed_images(run, images, rng)
+    author_ids = seed_users(run, max(users, 1), dream_team, batch_size)
+    with preserve_timestamps(*timestamps):
+        posts_created, comments_created = seed_posts(
+            run, posts, author_ids, comments_per_post, published_ratio,
+            image_names, image_ratio, batch_size, rng,
+        )
+
+    # bulk_create skips the signals that keep cached pages fresh and
+    # count the posts sharing each image
+    caching.bump_page_version()
+    media.recount(image_names)
+    return {'users': len(author_ids), 'posts': posts_created, 'comments': comments_created, 'images': len(image_names)}
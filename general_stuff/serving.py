@@ -0,0 +1,226 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from . import images
+from . import media
+from . import models
+from .caching import PAGE_CACHE_TIMEOUT, page_version
+
+# hashed names never change content, a year is the conventional "forever"
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# an unhashed name may point at new content after the next build
+REVALIDATE = 'public, max-age=0, must-revalidate'
+# media of drafts, for their authors and staff only
+PRIVATE = 'private, max-age=0, must-revalidate'
+# preferred first, written by general_stuff.assets.compress
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# a resized copy, see images.save_variants; the suffix is the one
+# FileSystemStorage adds to a taken name
+VARIANT_NAME = re.compile(rf'^{images.VARIANTS_DIR}/(?P<stem>.+)_\d+w(_[a-zA-Z0-9]{{7}})?\.\w+$')
+BYTE_RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def static_file(request, path):
+    """
+    Serves a file from STATIC_ROOT for deployments without a proxy in
+    front: the precompressed sibling the client accepts, far-future
+    immutable caching for hashed names, Last-Modified for the rest.
+    """
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    if not os.path.isfile(fullpath) or fullpath.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+        raise Http404(path)
+
+    mtime = os.stat(fullpath).st_mtime
+    hashed = path in getattr(staticfiles_storage, 'hashed_names', ())
+    cache_control = IMMUTABLE if hashed else REVALIDATE
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime):
+        response = HttpResponseNotModified()
+        response['Cache-Control'] = cache_control
+        return response
+
+    served, encoding = fullpath, None
+    accepted = accepted_encodings(request)
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(fullpath + suffix):
+            served, encoding = fullpath + suffix, coding
+            break
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def media_owners(name):
+    """
+    None when anyone may read the upload `name`, otherwise the ids of the
+    users who may besides staff: the authors of the drafts that are the
+    only rows using it. Variants follow their source.
+    """
+    variant = VARIANT_NAME.match(name)
+    if variant:
+        # names starting with "<stem>.", as a range the index can serve
+        low, high = f"{variant['stem']}.", f"{variant['stem']}/"
+        posts, avatars = Q(image__gte=low, image__lt=high), Q(avatar__gte=low, avatar__lt=high)
+    else:
+        posts, avatars = Q(image=name), Q(avatar=name)
+
+    using = list(models.Post.objects.filter(posts).order_by().values_list('is_published', 'author_id'))
+    if not using or any(published for published, _ in using):
+        return None
+    if models.UserInfo.objects.filter(avatars).exists():
+        return None
+    return [author_id for _, author_id in using]
+
+
+def requested_range(request, size, etag, last_modified):
+    """
+    (first, last) byte of a satisfiable single range request, None to send
+    the whole file and False when the range lies past its end.
+    """
+    match = BYTE_RANGE.match(request.META.get('HTTP_RANGE', '').replace(' ', ''))
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # several ranges get the whole file, which is a valid answer to them
+    if not match or not size or (if_range and if_range not in (etag, http_date(last_modified))):
+        return None
+
+    start, end = match['start'], match['end']
+    if not start:
+        if not end:
+            return None
+        # the last `end` bytes
+        return (max(size - int(end), 0), size - 1) if int(end) else False
+    start, end = int(start), int(end) if end else size - 1
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRange:
+    """
+    `length` bytes of an open file from its current position. It keeps
+    fileno(), so servers with wsgi.file_wrapper still sendfile() them.
+    """
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def media_file(request, path):
+    """
+    Serves an upload from MEDIA_ROOT. Media of drafts go to their authors
+    and staff only. Answers conditional GET and byte ranges itself, or with
+    MEDIA_OFFLOAD set leaves sending the file to the proxy in front.
+    """
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    if not os.path.isfile(fullpath):
+        raise Http404(path)
+
+    # every post and profile change bumps the page version, shared by the
+    # workers through the cache
+    key = f'general_stuff:media-owners:{page_version()}:{hashlib.sha256(path.encode()).hexdigest()}'
+    owners = cache.get_or_set(key, lambda: media_owners(path), PAGE_CACHE_TIMEOUT)
+    if owners is None:
+        # blobs and their variants never change content under the same name
+        variant = VARIANT_NAME.match(path)
+        cache_control = IMMUTABLE if media.is_blob(variant['stem'] if variant else path) else REVALIDATE
+    elif request.user.is_staff or request.user.pk in owners:
+        cache_control = PRIVATE
+    else:
+        # the same answer as for a name nobody uploaded
+        raise Http404(path)
+
+    stat = os.stat(fullpath)
+    last_modified = int(stat.st_mtime)
+    # nginx's format, so validators match whichever of the two answered
+    etag = f'"{last_modified:x}-{stat.st_size:x}"'
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = send_media(request, path, fullpath, stat.st_size, etag, last_modified, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def send_media(request, path, fullpath, size, etag, last_modified, content_type):
+    offload = settings.MEDIA_OFFLOAD
+    if offload == 'x-accel-redirect':
+        # nginx serves the file from an internal location, ranges included
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        return response
+    if offload == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return response
+    if offload:
+        raise ImproperlyConfigured(f"MEDIA_OFFLOAD must be 'x-accel-redirect', 'x-sendfile' or empty, not {offload!r}")
+
+    byte_range = requested_range(request, size, etag, last_modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,112 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from . import auth
+from . import caching
+from . import images
+from . import media
+from . import metrics
+from . import models
+from . import profiles
+from .context_processors import SIDEBAR_CACHE_KEY
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    metrics.install(connection)
+
+
+def is_login_only(update_fields):
+    # auth updates last_login on every sign in, nothing rendered depends on it
+    return bool(update_fields) and set(update_fields) <= {'last_login'}
+
+
+@receiver([post_save, post_delete], sender=models.Tagline)
+@receiver([post_save, post_delete], sender=models.UserInfo)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_sidebar(sender, update_fields=None, **kwargs):
+    if is_login_only(update_fields):
+        return
+
+    cache.delete(SIDEBAR_CACHE_KEY)
+
+
+@receiver([post_save, post_delete], sender=models.Post)
+@receiver([post_save, post_delete], sender=models.Tagline)
+@receiver([post_save, post_delete], sender=models.UserInfo)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_pages(sender, update_fields=None, **kwargs):
+    if is_login_only(update_fields):
+        return
+
+    caching.bump_page_version()
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # last_login included: the cached copy should match the row
+    auth.forget_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=models.UserInfo)
+def forget_cached_profile_owner(sender, instance, **kwargs):
+    auth.forget_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_profile_block(sender, instance, update_fields=None, **kwargs):
+    if is_login_only(update_fields):
+        return
+
+    profiles.forget_profile_block(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=models.UserInfo)
+def forget_owner_profile_block(sender, instance, **kwargs):
+    profiles.forget_profile_block(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=models.Post)
+def forget_author_profile_block(sender, instance, **kwargs):
+    # the block counts the author's published posts
+    profiles.forget_profile_block(instance.author_id)
+
+
+@receiver(post_save, sender=models.Post)
+def build_post_image_variants(sender, instance, **kwargs):
+    images.build_variants(instance, 'image', 'image_variants')
+
+
+@receiver(post_save, sender=models.UserInfo)
+def build_avatar_variants(sender, instance, **kwargs):
+    images.build_variants(instance, 'avatar', 'avatar_variants')
+
+
+@receiver(post_delete, sender=models.Post)
+def delete_post_image_variants(sender, instance, **kwargs):
+    images.delete_variants(instance.image.storage, instance.image_variants)
+
+
+@receiver(post_delete, sender=models.UserInfo)
+def delete_avatar_variants(sender, instance, **kwargs):
+    images.delete_variants(instance.avatar.storage, instance.avatar_variants)
+
+
+@receiver(post_init, sender=models.Post)
+@receiver(post_init, sender=models.UserInfo)
+def remember_media(sender, instance, **kwargs):
+    media.remember(instance)
+
+
+@receiver(post_save, sender=models.Post)
+@receiver(post_save, sender=models.UserInfo)
+def count_media_refs(sender, instance, created, update_fields=None, **kwargs):
+    media.track(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=models.Post)
+@receiver(post_delete, sender=models.UserInfo)
+def release_media(sender, instance, **kwargs):
+    media.forget(instance)
@@ -0,0 +1,119 @@
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from . import models
+from .bulk import batched
+from .caching import PAGE_CACHE_TIMEOUT, page_version
+from .conditional import conditional_page, make_etag
+
+# sitemap.xml is an index of sections, section n lists the published posts
+# with ids in [n * SECTION_SIZE, (n + 1) * SECTION_SIZE). A post change only
+# alters its own section, so only that one is rebuilt and crawlers reading
+# the index only fetch that one again.
+SECTION_SIZE = 1000
+# rows rendered per chunk of a streamed section
+STREAM_BATCH = 250
+CONTENT_TYPE = 'application/xml; charset=utf-8'
+
+INDEX_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_ENTRY = '<sitemap><loc>{loc}</loc><lastmod>{lastmod}</lastmod></sitemap>\n'
+INDEX_FOOT = '</sitemapindex>\n'
+SECTION_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+SECTION_ENTRY = '<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>\n'
+SECTION_FOOT = '</urlset>\n'
+
+
+def _build_sections():
+    rows = (
+        models.Post.objects.filter(is_published=True)
+        .annotate(section=F('id') / SECTION_SIZE)
+        .values('section')
+        .annotate(lastmod=Max('updated_at'), posts=Count('id'))
+        .order_by('section')
+    )
+    return {row['section']: (row['lastmod'], row['posts']) for row in rows}
+
+
+def sections():
+    """
+    section -> (newest change, published posts). Edits move the newest
+    change, deletes and unpublishing the count, so the pair tells whether
+    a section's cached body is still current.
+    """
+    # every post change bumps the page version, so per version it's constant:
+    # saves through the signals, .update() and bulk_update() callers by hand,
+    # comments.py included
+    return cache.get_or_set(f'general_stuff:sitemap-sections:{page_version()}', _build_sections, PAGE_CACHE_TIMEOUT)
+
+
+def sitemap_last_modified(request, section=None):
+    found = sections()
+    if section is None:
+        return max((lastmod for lastmod, _ in found.values()), default=None)
+    return found.get(section, (None, 0))[0]
+
+
+def sitemap_etag(request, section=None):
+    found = sections()
+    if section is None:
+        state = sorted(found.items())
+    elif section in found:
+        state = found[section]
+    else:
+        return None
+    # the host is part of every <loc>
+    return make_etag(request.build_absolute_uri('/'), section, state)
+
+
+def _stream_section(request, section, key):
+    # yields the section as it is read and caches it once it's complete
+    posts = models.Post.objects.filter(
+        is_published=True, id__gte=section * SECTION_SIZE, id__lt=(section + 1) * SECTION_SIZE
+    ).order_by('id').only('slug', 'updated_at')
+
+    parts = []
+    for batch in batched(posts.iterator(chunk_size=STREAM_BATCH), STREAM_BATCH):
+        part = ''.join(
+            SECTION_ENTRY.format(
+                loc=escape(request.build_absolute_uri(post.get_absolute_url())),
+                lastmod=post.updated_at.isoformat(),
+            )
+            for post in batch
+        )
+        parts.append(part)
+        yield part
+    cache.set(key, ''.join(parts), PAGE_CACHE_TIMEOUT)
+
+
+@conditional_page(sitemap_etag, sitemap_last_modified)
+def sitemap_index(request):
+    entries = ''.join(
+        INDEX_ENTRY.format(
+            loc=escape(request.build_absolute_uri(reverse('sitemap-section', kwargs={'section': section}))),
+            lastmod=lastmod.isoformat(),
+        )
+        for section, (lastmod, _) in sorted(sections().items())
+    )
+    return HttpResponse(INDEX_HEAD + entries + INDEX_FOOT, content_type=CONTENT_TYPE)
+
+
+@conditional_page(sitemap_etag, sitemap_last_modified)
+def sitemap_section(request, section):
+    found = sections()
+    if section not in found:
+        raise Http404('Нет такого раздела карты сайта')
+
+    # keyed by the section's own state, changes elsewhere leave it cached
+    key = f'general_stuff:sitemap-section:{make_etag(request.build_absolute_uri("/"), section, found[section])}'
+    body = cache.get(key)
+    entries = [body] if body is not None else _stream_section(request, section, key)
+
+    def stream():
+        yield SECTION_HEAD
+        yield from entries
+        yield SECTION_FOOT
+
+    return StreamingHttpResponse(stream(), content_type=CONTENT_TYPE)
@@ -0,0 +1,120 @@
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from . import models
+
+RUSSIAN_TO_ENGLISH = {
+    "а": "a",
+    "б": "b",
+    "в": "v",
+    "г": "g",
+    "д": "d",
+    "е": "e",
+    "ё": "yo",
+    "ж": "zh",
+    "з": "z",
+    "и": "i",
+    "й": "y",
+    "к": "k",
+    "л": "l",
+    "м": "m",
+    "н": "n",
+    "о": "o",
+    "п": "p",
+    "р": "r",
+    "с": "s",
+    "т": "t",
+    "у": "u",
+    "ф": "f",
+    "х": "x",
+    "ц": "c",
+    "ч": "ch",
+    "ш": "sh",
+    "щ": "shch",
+    "ъ": "",
+    "ы": "y",
+    "ь": "",
+    "э": "e",
+    "ю": "yu",
+    "я": "ya",
+}
+
+# one C-level pass instead of a str.replace per letter
+TRANSLITERATION = str.maketrans(RUSSIAN_TO_ENGLISH)
+NOT_SLUG_RE = re.compile(r'[^\w\-]')
+SUFFIX_RE = re.compile(r'-(\d+)$')
+
+SLUG_MAX_LENGTH = models.Post._meta.get_field('slug').max_length
+# room left for a "-123" suffix when the title fills the whole column
+SUFFIX_RESERVE = 6
+CREATE_ATTEMPTS = 5
+
+
+def slugify_title(title):
+    slug = '-'.join(title.lower().translate(TRANSLITERATION).split())
+    slug = NOT_SLUG_RE.sub('', slug)[:SLUG_MAX_LENGTH].strip('-')
+    return slug or 'post'
+
+
+def with_suffix(base, number):
+    if number < 2:
+        return base
+    suffix = f'-{number}'
+    return base[:SLUG_MAX_LENGTH - len(suffix)].rstrip('-') + suffix
+
+
+def numbered_slugs(base):
+    """
+    Posts holding `base` or one of its numbered forms, with_suffix(base, n),
+    and not every slug sharing the prefix.
+    """
+    stem = base[:SLUG_MAX_LENGTH - SUFFIX_RESERVE].rstrip('-')
+    # what with_suffix() leaves of the base for suffixes of every length
+    prefixes = {base[:SLUG_MAX_LENGTH - length].rstrip('-') for length in range(2, SUFFIX_RESERVE + 2)}
+    numbered = '|'.join(sorted(map(re.escape, prefixes)))
+
+    # the range keeps the lookup on the slug index, the regex keeps other
+    # titles that start the same way out of the result
+    return models.Post.objects.filter(slug__gte=stem, slug__lt=f'{stem}\uffff').filter(
+        Q(slug=base) | Q(slug__regex=rf'^({numbered})-[0-9]+$')
+    )
+
+
+def unique_slug(title, exclude_pk=None, reserved=()):
+    """
+    Readable unique slug for `title`: "title", then "title-2", "title-3"...
+    All taken candidates are fetched with a single query.
+    """
+    base = slugify_title(title)
+
+    taken = numbered_slugs(base)
+    if exclude_pk is not None:
+        taken = taken.exclude(pk=exclude_pk)
+    taken = set(taken.values_list('slug', flat=True)) | set(reserved)
+
+    if base not in taken:
+        return base
+
+    numbers = [int(match.group(1)) for match in map(SUFFIX_RE.search, taken) if match]
+    numbers = [n for n in numbers if n >= 2 and with_suffix(base, n) in taken]
+    number = max(numbers, default=1) + 1
+
+    while with_suffix(base, number) in taken:
+        number += 1
+    return with_suffix(base, number)
+
+
+def create_post(**fields):
+    """
+    Creates a post with a unique slug. A concurrent create may grab the
+    same slug between the lookup and the insert, then the unique
+    constraint fails and the slug is picked again.
+    """
+    for attempt in range(CREATE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return models.Post.objects.create(slug=unique_slug(fields['title']), **fields)
+        except IntegrityError:
+            if attempt == CREATE_ATTEMPTS - 1:
+                raise
@@ -0,0 +1,81 @@
+import copy
+from datetime import timedelta
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.db.models import Max, Min
+from django.utils import timezone
+
+register = template.Library()
+
+
+def _truncate(moment, kind):
+    if kind == 'year':
+        return moment.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if kind == 'month':
+        return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next(moment, kind):
+    if kind == 'year':
+        return moment.replace(year=moment.year + 1)
+    if kind == 'month':
+        return moment.replace(year=moment.year + moment.month // 12, month=moment.month % 12 + 1)
+    return moment + timedelta(days=1)
+
+
+class IndexedDates:
+    """
+    Stands in for the changelist queryset in date_hierarchy. Its
+    datetimes() is a SELECT DISTINCT over every row of the list, here the
+    range comes from Min/Max and each year, month or day in it is one
+    exists() on the index. `undated`, the list without the range already
+    picked, is what the probes filter, see admin.ScalableChangeList.
+    """
+    def __init__(self, queryset, undated=None):
+        self.queryset = queryset
+        self.undated = queryset if undated is None else undated
+        self._aggregates = {}
+
+    def aggregate(self, **kwargs):
+        # one aggregate per query, SQLite only reads a lone Min or Max off
+        # the index; date_hierarchy asks for the ones datetimes() starts from
+        result = {}
+        for name, expression in kwargs.items():
+            key = repr(expression)
+            if key not in self._aggregates:
+                self._aggregates[key] = self.queryset.aggregate(value=expression)['value']
+            result[name] = self._aggregates[key]
+        return result
+
+    def datetimes(self, field_name, kind):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+
+        aware = timezone.is_aware(bounds['first'])
+        if aware:
+            bounds = {key: timezone.localtime(value).replace(tzinfo=None) for key, value in bounds.items()}
+
+        def query_value(moment):
+            return timezone.make_aware(moment) if aware else moment
+
+        found = []
+        moment = _truncate(bounds['first'], kind)
+        while moment <= bounds['last']:
+            following = _next(moment, kind)
+            rows = self.undated.filter(**{
+                f'{field_name}__gte': query_value(moment), f'{field_name}__lt': query_value(following),
+            })
+            if rows.exists():
+                found.append(moment)
+            moment = following
+        return found
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def indexed_date_hierarchy(cl):
+    indexed = copy.copy(cl)
+    indexed.queryset = IndexedDates(cl.queryset, getattr(cl, 'undated_queryset', None))
+    return date_hierarchy(indexed)
@@ -0,0 +1,56 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+def _srcset(storage, sources):
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in sources)
+
+
+def variant_url(field_file, manifest, width, extension='webp'):
+    # closest variant that is at least `width` wide, falls back to the original
+    sources = (manifest or {}).get('sources', {}).get(extension)
+    if not sources or manifest.get('source') != field_file.name:
+        return field_file.url
+
+    for source_width, name in sources:
+        if source_width >= width:
+            return field_file.storage.url(name)
+    return field_file.storage.url(sources[-1][1])
+
+
+@register.simple_tag
+def responsive_image(field_file, manifest, sizes='100vw', alt='', lazy=True, **attrs):
+    """
+    <picture> with webp/jpeg srcsets built from the variants manifest,
+    see general_stuff/images.py. Until the variants are rendered the
+    original file is used.
+    """
+    style = attrs.pop('style', '')
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    loading = 'lazy' if lazy else 'eager'
+
+    if not manifest or manifest.get('source') != field_file.name:
+        return format_html(
+            '<img src="{}" alt="{}" loading="{}" decoding="async" style="{}"{}>',
+            field_file.url, alt, loading, style, extra
+        )
+
+    storage = field_file.storage
+    sources = manifest['sources']
+    fallback = sources['jpg'][0][1]
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" '
+        'loading="{}" decoding="async" '
+        'style="background: url({}) center / cover no-repeat; {}"{}>'
+        '</picture>',
+        _srcset(storage, sources['webp']), sizes,
+        storage.url(fallback), _srcset(storage, sources['jpg']), sizes,
+        manifest['width'], manifest['height'], alt,
+        loading,
+        manifest['placeholder'], style, extra,
+    )
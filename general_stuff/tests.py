@@ -1,3 +1,1516 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import skipUnless
 
-# Create your tests here.
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from . import assets
+from . import caching
+from . import comments
+from . import images
+from . import media
+from . import metrics
+from . import models
+from . import profiles
+from . import rendering
+from . import search
+from . import seeding
+from . import serving
+from . import slugs
+from .context_processors import SIDEBAR_CACHE_KEY, get_sidebar
+from .db.base import ConnectionPool
+from .pagination import EstimatedCountPaginator, InvalidCursor, KeysetPaginator
+from .views import FEED_PAGE_SIZE
+
+USERS = 30
+DREAM_TEAM = 6
+POSTS = 60
+DRAFTS = 10
+COMMENTS_PER_POST = 3
+
+# total time spent in SQL for a single request, in seconds
+QUERY_TIME_BUDGET = 0.1
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Seeds more rows than any page shows, so a query per row (N+1) pushes
+    a view over its budget no matter how small the budget slack is.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com') for i in range(USERS)
+        )
+        models.UserInfo.objects.bulk_create(
+            models.UserInfo(user=user, status=f'status {i}', dream_team=i < DREAM_TEAM)
+            for i, user in enumerate([cls.staff] + users)
+        )
+        models.Tagline.objects.create(title='Девиз', text='Legends Never Die')
+
+        posts = [
+            models.Post(
+                title=f'Пост номер {i}',
+                slug=f'post-{i}',
+                text=f'Текст поста {i} про дожди и музыку. ' * 40,
+                is_published=i >= DRAFTS,
+                author=users[i % USERS],
+            )
+            for i in range(POSTS)
+        ]
+        for post in posts:
+            post.refresh_from_text()
+        posts = models.Post.objects.bulk_create(posts)
+        models.Comment.objects.bulk_create(
+            models.Comment(post=post, author=users[(i + j) % USERS], text=f'Комментарий {j}')
+            for i, post in enumerate(posts)
+            for j in range(COMMENTS_PER_POST)
+        )
+        comments.recount_comments([post.pk for post in posts], touch=False)
+        cls.post = posts[-1]
+        cls.user = users[0]
+
+    def setUp(self):
+        cache.clear()
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_time=QUERY_TIME_BUDGET):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+
+        queries = context.captured_queries
+        executed = '\n'.join(query['sql'] for query in queries)
+        self.assertLessEqual(
+            len(queries), max_queries,
+            f'{len(queries)} queries, budget is {max_queries}:\n{executed}'
+        )
+
+        spent = sum(float(query['time']) for query in queries)
+        self.assertLessEqual(spent, max_time, f'{spent:.3f}s spent in SQL:\n{executed}')
+
+
+class AnonymousQueryBudgetTest(QueryBudgetTestCase):
+    def test_home(self):
+        # newest post for the validators, tagline, dream team, one page of posts
+        with self.assertQueryBudget(4):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_home_warm_sidebar(self):
+        self.client.get(reverse('home'))
+        with self.assertQueryBudget(1):
+            self.client.get(reverse('home'))
+
+    def test_home_next_page(self):
+        response = self.client.get(reverse('home'))
+        cursor = response.context['page'].next_cursor
+        with self.assertQueryBudget(3):
+            response = self.client.get(reverse('home'), {'after': cursor})
+        self.assertEqual(response.status_code, 200)
+
+    def test_search(self):
+        with self.assertQueryBudget(3):
+            response = self.client.get(reverse('home'), {'q': 'дожди'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].paginator.count, POSTS - DRAFTS)
+
+    def test_load_more(self):
+        with self.assertQueryBudget(1):
+            response = self.client.get(reverse('load-more'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_about(self):
+        with self.assertQueryBudget(0):
+            self.client.get(reverse('about'))
+
+    def test_sign_up(self):
+        with self.assertQueryBudget(0):
+            self.client.get(reverse('sign-up'))
+
+
+class AuthenticatedQueryBudgetTest(QueryBudgetTestCase):
+    # the user lookup done by the auth middleware, sessions come from the
+    # cache and setUp starts every test with a cold user cache
+    AUTH_QUERIES = 1
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+
+    def test_post_detail(self):
+        # conditional GET validator, post with its author, a page of
+        # comments with their authors, the cold sidebar
+        with self.assertQueryBudget(self.AUTH_QUERIES + 5):
+            response = self.client.get(self.post.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_missing(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 2):
+            response = self.client.get(reverse('post-detail', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_posts(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 1):
+            response = self.client.get(reverse('posts'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_with_drafts(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 3):
+            response = self.client.get(reverse('home'), {'q': 'дожди'})
+        self.assertEqual(response.context['page_obj'].paginator.count, POSTS)
+
+    def test_user_profile(self):
+        # the user with the profile, a page of posts, the post count of the cold block
+        with self.assertQueryBudget(self.AUTH_QUERIES + 3):
+            response = self.client.get(reverse('user-profile', kwargs={'username': self.user.username}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_profile_update(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 1):
+            response = self.client.get(reverse('user-profile-update', kwargs={'username': 'staff'}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_tagline(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 1):
+            response = self.client.get(reverse('tagline'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_create(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES):
+            response = self.client.get(reverse('post-create'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_update(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 1):
+            response = self.client.get(reverse('post-update', kwargs={'slug': self.post.slug}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_delete_confirm(self):
+        with self.assertQueryBudget(self.AUTH_QUERIES + 1):
+            response = self.client.get(reverse('post-delete-confirm', kwargs={'slug': self.post.slug}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_delete(self):
+        # the post, its comments cascade, then the delete itself
+        with self.assertQueryBudget(self.AUTH_QUERIES + 4):
+            response = self.client.get(reverse('post-delete', kwargs={'slug': self.post.slug, 'confirm': 1}))
+        self.assertEqual(response.status_code, 301)
+
+    def test_logout(self):
+        # the session is flushed: looked up again and deleted
+        with self.assertQueryBudget(self.AUTH_QUERIES + 2):
+            response = self.client.get(reverse('logout'))
+        self.assertEqual(response.status_code, 301)
+
+
+class PageCacheTest(QueryBudgetTestCase):
+    def test_anonymous_home_is_cached(self):
+        self.client.get(reverse('home'))
+        # only the newest post for the validators
+        with self.assertQueryBudget(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_change_invalidates(self):
+        self.client.get(reverse('home'))
+        self.post.title = 'Свежий заголовок'
+        self.post.save()
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Свежий заголовок')
+
+    def test_pending_messages_bypass_cache(self):
+        self.client.get(reverse('home'))
+        # the search redirects home with a flash message when nothing is found
+        response = self.client.get(reverse('home'), {'q': 'ничегоподобного'}, follow=True)
+        self.assertContains(response, 'Найдено 0 постов!')
+
+    def test_authenticated_not_cached(self):
+        self.client.get(reverse('home'))
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Написать пост')
+
+    def test_version_not_reused_after_flush(self):
+        version = caching.page_version()
+        caching.bump_page_version()
+        cache.clear()
+        self.assertNotIn(caching.page_version(), (version, version + 1))
+
+    def test_deploy_check_wants_shared_cache(self):
+        errors = [error.id for error in checks.run_checks(include_deployment_checks=True, tags=['caches'])]
+        self.assertIn('general_stuff.E001', errors)
+
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(CACHES=redis):
+            errors = [error.id for error in checks.run_checks(include_deployment_checks=True, tags=['caches'])]
+        self.assertNotIn('general_stuff.E001', errors)
+
+
+class KeysetPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        posts = models.Post.objects.bulk_create(
+            models.Post(title=f'Пост {i}', slug=f'post-{i}', text='текст', author=author, is_published=True)
+            for i in range(7)
+        )
+        # pairs share created_at, only the id tells them apart
+        start = timezone.now()
+        for i, post in enumerate(posts):
+            models.Post.objects.filter(pk=post.pk).update(created_at=start - timedelta(minutes=i // 2))
+        cls.ordered = list(models.Post.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.paginator = KeysetPaginator(models.Post.objects.all(), 3)
+
+    def pks(self, page):
+        return [post.pk for post in page]
+
+    def test_cursor_round_trip(self):
+        post = models.Post.objects.get(pk=self.ordered[2])
+        cursor = self.paginator.encode_cursor(post)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(self.paginator.decode_cursor(cursor), (post.created_at, post.pk))
+        self.assertEqual(self.paginator.key({'created_at': post.created_at, 'id': post.pk}), (post.created_at, post.pk))
+
+    def test_invalid_cursors(self):
+        def encoded(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for cursor in ('***', 'bm90IGpzb24', encoded({'id': 1}), encoded([1]), encoded(['вчера', 1])):
+            with self.subTest(cursor), self.assertRaises(InvalidCursor):
+                self.paginator.get_page(after=cursor)
+
+    def test_walk_forward_and_back(self):
+        first = self.paginator.get_page()
+        self.assertEqual(self.pks(first), self.ordered[:3])
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+        second = self.paginator.get_page(after=first.next_cursor)
+        last = self.paginator.get_page(after=second.next_cursor)
+        # a page boundary falls between two posts with the same created_at
+        self.assertEqual(self.pks(second), self.ordered[3:6])
+        self.assertEqual(self.pks(last), self.ordered[6:])
+        self.assertFalse(last.has_next)
+        self.assertTrue(last.has_previous)
+
+        self.assertEqual(self.pks(self.paginator.get_page(before=last.previous_cursor)), self.ordered[3:6])
+        back = self.paginator.get_page(before=second.previous_cursor)
+        self.assertEqual(self.pks(back), self.ordered[:3])
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_exact_last_page(self):
+        paginator = KeysetPaginator(models.Post.objects.all(), 7)
+        page = paginator.get_page()
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_other_pages)
+
+    def test_empty(self):
+        page = KeysetPaginator(models.Post.objects.none(), 3).get_page()
+        self.assertEqual(list(page), [])
+        self.assertFalse(page.has_other_pages)
+
+    def test_view_starts_over_on_bad_cursor(self):
+        response = self.client.get(reverse('load-more'), {'after': '***'})
+        newest = models.Post.objects.get(pk=self.ordered[0])
+        self.assertEqual(response.json()['results'][0]['title'], newest.title)
+
+
+class SearchTest(TestCase):
+    """
+    Runs against whichever search the database has: the in-process
+    index on SQLite, tsvector with ts_headline on PostgreSQL.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.title_hit = models.Post.objects.create(
+            title='Дожди', slug='rains', text='Про погоду.', author=author, is_published=True,
+        )
+        cls.text_hit = models.Post.objects.create(
+            title='Осень', slug='autumn', author=author, is_published=True,
+            text='Долгая осень <b>и</b> холодные дождями улицы, ' + 'слова ' * 80 + 'конец.',
+        )
+        cls.draft = models.Post.objects.create(
+            title='Черновик', slug='draft', text='Снова дожди.', author=author, is_published=False,
+        )
+        for i in range(5):
+            models.Post.objects.create(
+                title=f'Музыка {i}', slug=f'music-{i}', text='Про музыку.', author=author, is_published=True,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_word_forms_found(self):
+        for term in ('дожди', 'дождями', 'дождь'):
+            with self.subTest(term):
+                found = [post.pk for post in search.search_posts(term)[:10]]
+                self.assertCountEqual(found, [self.title_hit.pk, self.text_hit.pk])
+
+    def test_title_ranked_first(self):
+        found = search.search_posts('дожди')[:10]
+        self.assertEqual([post.pk for post in found], [self.title_hit.pk, self.text_hit.pk])
+        self.assertGreater(found[0].rank, found[1].rank)
+
+    def test_drafts_for_staff_only(self):
+        self.assertNotIn(self.draft.pk, [post.pk for post in search.search_posts('дожди')[:10]])
+        self.assertIn(self.draft.pk, [post.pk for post in search.search_posts('дожди', published_only=False)[:10]])
+
+    def test_headline(self):
+        [post] = [post for post in search.search_posts('дожди')[:10] if post.pk == self.text_hit.pk]
+        self.assertIn('<mark>дождями</mark>', post.headline)
+        self.assertIn('&lt;b&gt;', post.headline)
+        self.assertNotIn('<b>', post.headline)
+        self.assertLess(len(post.headline.split()), 80)
+
+    def test_pages(self):
+        paginator = Paginator(search.search_posts('музыка'), 2)
+        self.assertEqual((paginator.count, paginator.num_pages), (5, 3))
+        pages = [[post.pk for post in paginator.page(number)] for number in paginator.page_range]
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(len({pk for page in pages for pk in page}), 5)
+
+    def test_nothing_found(self):
+        self.assertEqual(search.search_posts('ничегоподобного').count(), 0)
+
+    def test_edit_without_signals(self):
+        search.search_posts('дожди')[:10]
+        # the index must not keep serving the old text
+        models.Post.objects.filter(pk=self.text_hit.pk).update(text='Про снег.')
+        caching.bump_page_version()
+
+        self.assertEqual([post.pk for post in search.search_posts('дожди')[:10]], [self.title_hit.pk])
+        self.assertEqual([post.pk for post in search.search_posts('снег')[:10]], [self.text_hit.pk])
+
+    @skipUnless(connection.vendor != 'postgresql', "the in-process index")
+    def test_stem(self):
+        self.assertEqual(search.stem('Дождями'), search.stem('дожди'))
+        self.assertEqual(search.stem('ёлки'), search.stem('елка'))
+        # too short to lose an ending
+        self.assertEqual(search.stem('дом'), 'дом')
+        self.assertEqual(search.tokenize('Дожди, music!'), ['дожд', 'music'])
+
+
+class SidebarTest(QueryBudgetTestCase):
+    def warm(self):
+        get_sidebar()
+        self.assertIsNotNone(cache.get(SIDEBAR_CACHE_KEY))
+
+    def test_tagline_save_clears(self):
+        self.warm()
+        tagline = models.Tagline.objects.get()
+        tagline.text = 'Новый девиз'
+        tagline.save()
+        self.assertIsNone(cache.get(SIDEBAR_CACHE_KEY))
+        self.assertContains(self.client.get(reverse('home')), 'Новый девиз')
+
+    def test_tagline_delete_clears(self):
+        self.warm()
+        models.Tagline.objects.get().delete()
+        self.assertIsNone(cache.get(SIDEBAR_CACHE_KEY))
+        self.assertIsNone(get_sidebar()['tagline'])
+
+    def test_dream_team_change_clears(self):
+        self.warm()
+        info = models.UserInfo.objects.filter(dream_team=False).select_related('user').first()
+        info.dream_team = True
+        info.save()
+        self.assertIsNone(cache.get(SIDEBAR_CACHE_KEY))
+        self.assertIn(info.user.username, get_sidebar()['dreamteam'])
+
+    def test_login_keeps_sidebar(self):
+        self.warm()
+        # updates only last_login
+        self.client.login(username='staff', password='password')
+        self.assertIsNotNone(cache.get(SIDEBAR_CACHE_KEY))
+
+
+class SlugTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+
+    def test_transliteration(self):
+        self.assertEqual(slugs.slugify_title('Привет, Мир! Ёлка  Щука'), 'privet-mir-yolka-shchuka')
+
+    def test_collisions_get_numbered(self):
+        created = [slugs.create_post(title='Три дня дождя', text='.', author=self.author) for _ in range(3)]
+        self.assertEqual([post.slug for post in created], ['tri-dnya-dozhdya', 'tri-dnya-dozhdya-2', 'tri-dnya-dozhdya-3'])
+
+    def test_long_title_fits_with_suffix(self):
+        title = 'Очень длинный заголовок который не влезет в поле'
+        first = slugs.create_post(title=title, text='.', author=self.author)
+        second = slugs.create_post(title=title, text='.', author=self.author)
+        self.assertLessEqual(len(second.slug), slugs.SLUG_MAX_LENGTH)
+        self.assertEqual(second.slug, slugs.with_suffix(first.slug, 2))
+
+    def test_only_numbered_forms_fetched(self):
+        for slug in ('dozhd', 'dozhd-2', 'dozhd-i-veter', 'dozhdi', 'dozhd-2-veter'):
+            models.Post.objects.create(title=slug, slug=slug, text='.', author=self.author)
+        self.assertCountEqual(slugs.numbered_slugs('dozhd').values_list('slug', flat=True), ['dozhd', 'dozhd-2'])
+        self.assertEqual(slugs.unique_slug('Дождь'), 'dozhd-3')
+
+    def test_collision_lookup_is_one_query(self):
+        slugs.create_post(title='Дождь', text='.', author=self.author)
+        with self.assertNumQueries(1):
+            self.assertEqual(slugs.unique_slug('Дождь'), 'dozhd-2')
+
+
+class ConditionalGetTest(QueryBudgetTestCase):
+    def test_home_not_modified(self):
+        response = self.client.get(reverse('home'))
+        self.assertTrue(response.has_header('ETag'))
+
+        with self.assertQueryBudget(1):
+            response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_home_modified_after_delete(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        models.Post.objects.filter(is_published=True).first().delete()
+
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_home_modified_without_signals(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        # a queryset update sends no signal, the page version stays put
+        models.Post.objects.filter(pk=self.post.pk).update(updated_at=timezone.now())
+
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_home_modified_after_cache_flush(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        models.Post.objects.filter(is_published=True).exclude(pk=self.post.pk).first().delete()
+        cache.clear()
+
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_not_modified(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.post.get_absolute_url())
+
+        with self.assertQueryBudget(3):
+            response = self.client.get(
+                self.post.get_absolute_url(),
+                HTTP_IF_NONE_MATCH=response['ETag'],
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_modified_after_edit(self):
+        self.client.force_login(self.staff)
+        etag = self.client.get(self.post.get_absolute_url())['ETag']
+        self.post.text = 'Новый текст'
+        self.post.save()
+
+        response = self.client.get(self.post.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый текст')
+
+
+class CommentTest(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_add_comment_updates_counter(self):
+        response = self.client.post(
+            reverse('comment-create', kwargs={'slug': self.post.slug}), {'text': 'Отличный пост'}
+        )
+        self.assertEqual(response.status_code, 302)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, COMMENTS_PER_POST + 1)
+        self.assertContains(self.client.get(self.post.get_absolute_url()), 'Отличный пост')
+
+    def test_delete_comments_updates_counter(self):
+        comments.delete_comments(models.Comment.objects.filter(post=self.post))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_comment_pages(self):
+        for i in range(30):
+            comments.add_comment(self.post, self.user, f'Комментарий номер {i}')
+
+        first = self.client.get(self.post.get_absolute_url()).context['comments']
+        second = self.client.get(self.post.get_absolute_url(), {'after': first.next_cursor}).context['comments']
+
+        seen = [comment.pk for comment in first] + [comment.pk for comment in second]
+        self.assertEqual(len(set(seen)), COMMENTS_PER_POST + 30)
+        self.assertFalse(second.has_next)
+
+
+class ImportExportTest(QueryBudgetTestCase):
+    def snapshot(self):
+        return (
+            sorted(User.objects.values_list('username', 'email', 'password')),
+            sorted(models.UserInfo.objects.values_list('user__username', 'status', 'dream_team')),
+            sorted(models.Post.objects.values_list('slug', 'title', 'author__username', 'created_at', 'updated_at')),
+            sorted(models.Post.objects.values_list('slug', 'comment_count')),
+            sorted(models.Comment.objects.values_list('post__slug', 'author__username', 'text', 'created_at')),
+        )
+
+    def export(self):
+        directory = tempfile.mkdtemp()
+        call_command('export_content', directory, skip_media=True, stdout=StringIO())
+        return directory
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        directory = self.export()
+        User.objects.all().delete()
+
+        call_command('import_content', directory, batch_size=7, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+
+    def test_replay_adds_nothing(self):
+        before = self.snapshot()
+        directory = self.export()
+
+        # a crash after a batch commits but before its checkpoint is
+        # written replays the batch, here every batch at once
+        call_command('import_content', directory, batch_size=7, restart=True, stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+
+    def test_resumes_from_checkpoint(self):
+        directory = self.export()
+        User.objects.all().delete()
+        call_command('import_content', directory, batch_size=7, stdout=StringIO())
+        imported = self.snapshot()
+
+        out = StringIO()
+        call_command('import_content', directory, stdout=out)
+        self.assertIn('comment: 0 records read', out.getvalue())
+        self.assertEqual(self.snapshot(), imported)
+
+    def test_username_collision_stops_import(self):
+        directory = self.export()
+        User.objects.all().delete()
+        stranger = User.objects.create_user('user3', email='stranger@example.com')
+
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 user records collide'):
+            call_command('import_content', directory, stdout=StringIO(), stderr=err)
+        self.assertIn('user user3 already exists with different data', err.getvalue())
+        self.assertFalse(models.Post.objects.filter(author=stranger).exists())
+        self.assertFalse(models.UserInfo.objects.filter(user=stranger).exists())
+
+    def test_slug_collision_stops_import(self):
+        directory = self.export()
+        models.Post.objects.all().delete()
+        other = models.Post.objects.create(title='Другой', slug='post-1', text='текст', author=self.staff)
+
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 post records collide'):
+            call_command('import_content', directory, stdout=StringIO(), stderr=err)
+        self.assertIn('post post-1 already exists with different data', err.getvalue())
+        self.assertFalse(models.Comment.objects.filter(post=other).exists())
+
+
+class QueryPlanTest(TestCase):
+    def test_seed_counts(self):
+        created = seeding.seed(users=10, posts=50, comments_per_post=2, batch_size=20)
+        self.assertEqual(models.Post.objects.count(), 50)
+        self.assertEqual(models.Comment.objects.count(), created['comments'])
+        self.assertEqual(
+            sum(models.Post.objects.values_list('comment_count', flat=True)), created['comments']
+        )
+
+    def test_hot_queries_use_indexes(self):
+        call_command('check_query_plans', seed=500, stdout=StringIO())
+
+
+class BenchmarkTest(TransactionTestCase):
+    # requests run on other threads, with their own connections, so the
+    # data has to be committed
+    def setUp(self):
+        cache.clear()
+        seeding.seed(users=5, posts=30, comments_per_post=2, batch_size=10)
+        User.objects.create_user('staff', is_staff=True)
+
+    def benchmark(self, **options):
+        output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        call_command(
+            'benchmark', requests=4, concurrency=2, only=['home', 'post detail'],
+            output=output, stdout=StringIO(), **options
+        )
+        with open(output) as file:
+            return json.load(file)['pages']
+
+    def test_wsgi(self):
+        pages = self.benchmark()
+        self.assertEqual(set(pages), {'home', 'post detail'})
+        self.assertEqual(pages['post detail']['requests'], 4)
+        self.assertEqual(pages['post detail']['errors'], 0)
+        self.assertGreater(pages['post detail']['queries_per_request'], 0)
+        self.assertLessEqual(pages['home']['p50_ms'], pages['home']['p99_ms'])
+
+    def test_site_cache_left_alone(self):
+        # the sessions and pages of the running site share the cache
+        cache.set('general_stuff:test-entry', 'kept')
+        self.benchmark()
+        self.assertEqual(cache.get('general_stuff:test-entry'), 'kept')
+
+    def test_async_views(self):
+        pages = self.benchmark(asgi=True, async_views=True)
+        self.assertEqual(pages['post detail']['errors'], 0)
+        self.assertGreater(pages['post detail']['queries_per_request'], 0)
+
+
+class MetricsTest(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def test_server_timing_for_staff(self):
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        self.client.force_login(self.user)
+        self.assertFalse(self.client.get(reverse('home')).has_header('Server-Timing'))
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('home'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, ')
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_with_debug(self):
+        self.assertTrue(self.client.get(reverse('home')).has_header('Server-Timing'))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_histograms_per_view(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer secret'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'website_responses_total{view="home",status="2xx"} 2')
+        self.assertContains(response, 'website_request_duration_seconds_count{view="home"} 2')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_scrape_needs_token_or_staff(self):
+        # what every request looks like behind the proxy
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_no_token_configured(self):
+        response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer '})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(ROOT_URLCONF='website.urls_async')
+class AsyncViewsTest(QueryBudgetTestCase):
+    async def test_home(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+        newest = models.Post.objects.filter(is_published=True).values_list('pk', flat=True)[:FEED_PAGE_SIZE]
+        self.assertEqual([post.pk for post in response.context['posts']], [pk async for pk in newest])
+        self.assertEqual(response.context['sidebar']['tagline']['text'], 'Legends Never Die')
+
+    async def test_home_not_modified(self):
+        response = await self.async_client.get(reverse('home'))
+        response = await self.async_client.get(reverse('home'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_post_detail_needs_login(self):
+        response = await self.async_client.get(self.post.get_absolute_url())
+        self.assertRedirects(response, '/login', fetch_redirect_response=False)
+
+    async def test_post_detail(self):
+        await sync_to_async(self.async_client.force_login)(self.staff)
+        response = await self.async_client.get(self.post.get_absolute_url())
+        self.assertContains(response, self.post.title)
+        self.assertEqual(len(response.context['comments']), COMMENTS_PER_POST)
+
+    async def test_posts_forbidden_for_non_staff(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('posts'))
+        self.assertEqual(response.status_code, 301)
+
+
+PIPELINE_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'general_stuff.assets.PrecompressedManifestStaticFilesStorage'},
+}
+
+
+class CachedAuthTest(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+        # warms the user cache
+        self.client.get(reverse('about'))
+
+    def assertNoAuthQueries(self, context):
+        tables = ('FROM "django_session"', 'FROM "auth_user"', 'FROM "general_stuff_userinfo"')
+        auth_queries = [
+            query['sql'] for query in context.captured_queries
+            if any(table in query['sql'] for table in tables)
+        ]
+        self.assertEqual(auth_queries, [])
+
+    def test_warm_pages_need_no_auth_queries(self):
+        for url in (reverse('about'), reverse('post-create'), reverse('posts')):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNoAuthQueries(context)
+
+    def test_profile_update_invalidates(self):
+        response = self.client.post(
+            reverse('user-profile-update', kwargs={'username': 'staff'}),
+            {'username': 'staff', 'first_name': 'Новое', 'email': 'staff@example.com', 'status': 'новый статус'},
+        )
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get(reverse('about'))
+        self.assertEqual(response.wsgi_request.user.first_name, 'Новое')
+        self.assertEqual(response.wsgi_request.user.userinfo.status, 'новый статус')
+
+    def test_sessions_from_model_backend_kept(self):
+        client = self.client_class()
+        client.force_login(self.staff, backend='django.contrib.auth.backends.ModelBackend')
+        response = client.get(reverse('post-create'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.staff)
+
+    def test_login_through_cached_backend(self):
+        self.assertIsNone(authenticate(username='staff', password='wrong'))
+        user = authenticate(username='staff', password='password')
+        self.assertEqual(user.backend, 'general_stuff.auth.CachedModelBackend')
+
+    def test_deactivated_user_is_logged_out(self):
+        self.staff.is_active = False
+        self.staff.save()
+        response = self.client.get(reverse('post-create'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+
+class ProdSettingsTest(SimpleTestCase):
+    def load(self, **environ):
+        environ = {
+            **os.environ, 'DJANGO_PROFILE': 'prod', 'DJANGO_SECRET_KEY': 'secret', 'DJANGO_ALLOWED_HOSTS': 'example.com',
+            'DJANGO_NAME': 'website', 'DJANGO_USER': 'website', 'DJANGO_CACHE_URL': '', **environ,
+        }
+        return subprocess.run(
+            [sys.executable, '-c', 'import website.settings as s; print(s.CACHES["default"]["BACKEND"])'],
+            cwd=settings.BASE_DIR, env=environ, capture_output=True, text=True,
+        )
+
+    def test_refuses_per_process_cache(self):
+        result = self.load()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('CACHE_URL', result.stderr)
+
+    def test_shared_cache(self):
+        result = self.load(DJANGO_CACHE_URL='redis://127.0.0.1:6379/0')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), 'django.core.cache.backends.redis.RedisCache')
+
+
+class ProfileTest(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+        self.url = reverse('user-profile', kwargs={'username': self.user.username})
+
+    def test_lists_published_posts(self):
+        response = self.client.get(self.url)
+        # post 0 of this user is a draft
+        self.assertEqual([post.title for post in response.context['posts']], [f'Пост номер {USERS}'])
+        self.assertContains(response, 'публикаций: 1')
+        self.assertNotContains(response, 'Править')
+
+    def test_block_cached(self):
+        self.client.get(self.url)
+        with self.assertQueryBudget(AuthenticatedQueryBudgetTest.AUTH_QUERIES + 1):
+            self.client.get(self.url)
+
+    def test_block_invalidated(self):
+        published = profiles.author_posts(self.user).count()
+        self.client.get(self.url)
+
+        models.Post.objects.create(title='Новый', slug='new', text='текст', author=self.user, is_published=True)
+        self.assertContains(self.client.get(self.url), f'публикаций: {published + 1}')
+
+        self.user.userinfo.status = 'новый статус'
+        self.user.userinfo.save()
+        self.assertContains(self.client.get(self.url), 'новый статус')
+
+    def test_owner_can_edit(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(self.url), 'Править')
+
+
+class ApiTest(QueryBudgetTestCase):
+    def test_post_list_pages(self):
+        url = reverse('api-posts')
+        slugs = []
+        while url:
+            # the newest post for the ETag, one page of posts
+            with self.assertQueryBudget(2):
+                data = self.client.get(url, {'limit': 7} if '?' not in url else None).json()
+            slugs += [post['slug'] for post in data['results']]
+            url = data['next']
+        self.assertEqual(len(slugs), POSTS - DRAFTS)
+        self.assertEqual(len(set(slugs)), len(slugs))
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get(reverse('api-posts'), {'fields': 'title,created_at'}).json()
+        self.assertEqual(set(data['results'][0]), {'title', 'created_at'})
+        sql = context.captured_queries[-1]['sql']
+        self.assertNotIn('"text"', sql)
+        self.assertNotIn('auth_user', sql)
+
+        response = self.client.get(reverse('api-posts'), {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('api-posts'), {'after': 'nonsense'}).status_code, 400)
+
+    def test_etag(self):
+        response = self.client.get(reverse('api-posts'))
+        # the newest post for the validator
+        with self.assertQueryBudget(1):
+            revalidated = self.client.get(reverse('api-posts'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+        self.post.title = 'Новое название'
+        self.post.save()
+        response = self.client.get(reverse('api-posts'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.json()['results'][0]['title'], 'Новое название')
+
+    def test_etag_follows_database(self):
+        etag = self.client.get(reverse('api-posts'))['ETag']
+        # no signal, no page version bump
+        models.Post.objects.filter(pk=self.post.pk).update(title='Тихая правка', updated_at=timezone.now())
+        response = self.client.get(reverse('api-posts'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_bodies_in_list_need_login(self):
+        for fields in ('title,html', 'text'):
+            response = self.client.get(reverse('api-posts'), {'fields': fields})
+            self.assertEqual(response.status_code, 401)
+
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('api-posts'), {'fields': 'slug,html'}).json()
+        self.assertEqual(data['results'][0]['html'], self.post.text_html)
+
+    def test_detail_needs_login(self):
+        url = reverse('api-post', kwargs={'slug': self.post.slug})
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.client.force_login(self.user)
+        data = self.client.get(url).json()
+        self.assertEqual(data['html'], self.post.text_html)
+        self.assertNotIn('text', data)
+        draft = reverse('api-post', kwargs={'slug': 'post-0'})
+        self.assertEqual(self.client.get(draft).status_code, 404)
+
+        data = self.client.get(reverse('api-author', kwargs={'username': self.user.username})).json()
+        self.assertEqual(data['status'], 'status 1')
+        self.assertEqual(data['published'], 1)
+        self.assertEqual(self.client.get(reverse('api-tagline')).json()['text'], 'Legends Never Die')
+
+
+class ExcerptTest(QueryBudgetTestCase):
+    def test_save_builds_excerpts(self):
+        post = models.Post.objects.create(title='Короткий', slug='short', text='раз два три', author=self.user)
+        self.assertEqual((post.excerpt, post.short_excerpt), ('раз два три', 'раз два три'))
+
+        post.text = 'слово ' * 100
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertTrue(post.short_excerpt.startswith('слово слово'))
+        self.assertTrue(post.short_excerpt.endswith('…'))
+        self.assertLessEqual(len(post.short_excerpt), models.SHORT_EXCERPT_LENGTH[1])
+        self.assertEqual(post.excerpt, models.excerpt(post.text, models.EXCERPT_LENGTH))
+
+    def test_lists_leave_text_in_database(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, self.post.excerpt)
+        self.assertFalse(any('"general_stuff_post"."text"' in query['sql'] for query in context.captured_queries))
+
+    def test_backfill(self):
+        models.Post.objects.update(excerpt='', short_excerpt='')
+        out = StringIO()
+        call_command('build_excerpts', batch_size=7, stdout=out)
+        self.assertIn(f'{POSTS} excerpts built', out.getvalue())
+        post = models.Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.excerpt, models.excerpt(post.text, models.EXCERPT_LENGTH))
+
+
+class RenderingTest(QueryBudgetTestCase):
+    def test_render_sanitizes(self):
+        html = rendering.render('**жирный** [ссылка](https://example.com)\n\n<script>alert(1)</script>\n\n```python\nx = 1\n```')
+        self.assertIn('<strong>жирный</strong>', html)
+        self.assertIn('rel="nofollow noopener noreferrer"', html)
+        self.assertIn('<code class="language-python">', html)
+        self.assertNotIn('<script', html)
+
+    def test_rendered_once_per_text(self):
+        post = models.Post.objects.create(title='Markdown', slug='markdown', text='# Заголовок', author=self.user)
+        self.assertEqual(post.text_html, '<h1>Заголовок</h1>')
+
+        post.text_html = 'не перерисован'
+        post.title = 'Новый заголовок'
+        post.save()
+        self.assertEqual(post.text_html, 'не перерисован')
+
+        post.text = 'другой *текст*'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p>другой <em>текст</em></p>')
+
+    def test_detail_shows_stored_html(self):
+        self.client.force_login(self.staff)
+        models.Post.objects.filter(pk=self.post.pk).update(text_html='<p>из хранилища</p>')
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertContains(response, '<p>из хранилища</p>', html=True)
+
+    def test_render_posts_command(self):
+        models.Post.objects.update(text_html='', render_version=0)
+        out = StringIO()
+        call_command('render_posts', workers=1, batch_size=7, stdout=out)
+        self.assertIn(f'{POSTS} posts rendered', out.getvalue())
+
+        post = models.Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text_html, rendering.render(post.text))
+        self.assertEqual(post.render_version, rendering.RENDERER_VERSION)
+
+        # nothing left to do, --all finds no stale hashes either
+        call_command('render_posts', '--all', workers=1, stdout=out)
+        self.assertIn('0 posts rendered', out.getvalue())
+
+
+class FeedTest(QueryBudgetTestCase):
+    def streamed(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_atom_feed(self):
+        # newest post for the validators, a page of posts with their authors
+        with self.assertQueryBudget(2):
+            response = self.client.get(reverse('feed-atom'))
+        self.assertContains(response, self.post.title)
+        self.assertNotContains(response, 'Пост номер 0<')
+
+        response = self.client.get(reverse('feed-atom'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_rss_feed_cached(self):
+        self.client.get(reverse('feed-rss'))
+        with self.assertQueryBudget(1):
+            response = self.client.get(reverse('feed-rss'))
+        self.assertEqual(response['Content-Type'], 'application/rss+xml; charset=utf-8')
+
+    def test_sitemap(self):
+        response = self.client.get(reverse('sitemap'))
+        self.assertContains(response, reverse('sitemap-section', kwargs={'section': 0}))
+
+        response = self.client.get(reverse('sitemap-section', kwargs={'section': 0}))
+        body = self.streamed(response)
+        self.assertEqual(body.count('<url>'), POSTS - DRAFTS)
+        self.assertIn(self.post.get_absolute_url(), body)
+        self.assertNotIn(reverse('post-detail', kwargs={'slug': 'post-0'}), body)
+
+        with self.assertQueryBudget(0):
+            response = self.client.get(reverse('sitemap-section', kwargs={'section': 0}))
+        self.assertEqual(self.streamed(response), body)
+
+    def test_sitemap_section_rebuilt_on_change(self):
+        url = reverse('sitemap-section', kwargs={'section': 0})
+        etag = self.client.get(url)['ETag']
+
+        self.post.is_published = False
+        self.post.save()
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.post.get_absolute_url(), self.streamed(response))
+
+    def test_comment_reaches_sitemap_and_feed(self):
+        url = reverse('sitemap-section', kwargs={'section': 0})
+        section = self.streamed(self.client.get(url))
+        feed = self.client.get(reverse('feed-atom')).content.decode()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comments.add_comment(self.post, self.user, 'Свежий комментарий')
+        updated_at = models.Post.objects.get(pk=self.post.pk).updated_at.isoformat()
+
+        changed = self.streamed(self.client.get(url))
+        self.assertNotEqual(changed, section)
+        self.assertIn(f'<lastmod>{updated_at}</lastmod>', changed)
+        changed = self.client.get(reverse('feed-atom')).content.decode()
+        self.assertNotEqual(changed, feed)
+        self.assertIn(f'<updated>{updated_at}</updated>', changed)
+
+    def test_deleted_comment_reaches_sitemap_index(self):
+        index = self.client.get(reverse('sitemap')).content
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comments.delete_comments(models.Comment.objects.filter(post=self.post))
+        updated_at = models.Post.objects.get(pk=self.post.pk).updated_at.isoformat()
+
+        response = self.client.get(reverse('sitemap'))
+        self.assertNotEqual(response.content, index)
+        self.assertContains(response, f'<lastmod>{updated_at}</lastmod>')
+
+    def test_missing_section(self):
+        response = self.client.get(reverse('sitemap-section', kwargs={'section': 99}))
+        self.assertEqual(response.status_code, 404)
+
+
+def jpeg(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class MediaTest(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        media_settings = override_settings(MEDIA_ROOT=self.root, IMAGE_VARIANT_WORKERS=0)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def post_with(self, slug, image):
+        return models.Post.objects.create(
+            title=slug, slug=slug, text='текст', author=self.user, image=image, is_published=True
+        )
+
+    def test_verify_media_catches_changed_content(self):
+        post = self.post_with('checked', SimpleUploadedFile('checked.jpg', jpeg('red')))
+        directory = tempfile.mkdtemp()
+        call_command('export_content', directory, stdout=StringIO())
+
+        # same size, different bytes
+        path = os.path.join(self.root, post.image.name)
+        with open(path, 'rb') as stored:
+            content = bytearray(stored.read())
+        content[-3] ^= 0xFF
+        with open(path, 'wb') as stored:
+            stored.write(content)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_content', directory, verify_media=True, stdout=out, stderr=err)
+        self.assertIn(f'content differs: {post.image.name}', err.getvalue())
+        self.assertIn('media check: 1 problems', out.getvalue())
+
+    def test_same_content_stored_once(self):
+        first = self.post_with('first', SimpleUploadedFile('first.jpg', jpeg('red')))
+        second = self.post_with('second', SimpleUploadedFile('second.jpg', jpeg('red')))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(media.is_blob(first.image.name))
+
+        self.user.userinfo.avatar = SimpleUploadedFile('me.jpg', jpeg('red'))
+        self.user.userinfo.save()
+        self.assertEqual(self.user.userinfo.avatar.name, first.image.name)
+        self.assertEqual(models.MediaBlob.objects.get().refs, 3)
+
+    def test_unused_blob_collected(self):
+        first = self.post_with('first', SimpleUploadedFile('first.jpg', jpeg('red')))
+        second = self.post_with('second', SimpleUploadedFile('second.jpg', jpeg('red')))
+        path = first.image.path
+        models.MediaBlob.objects.update(touched_at=timezone.now() - 2 * media.COLLECT_AFTER)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.image = SimpleUploadedFile('second.jpg', jpeg('blue'))
+            second.save()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(models.MediaBlob.objects.values_list('name', 'refs')), [(second.image.name, 1)])
+
+    def test_dedupe_media(self):
+        for name in ('avatars/me.jpg', 'posts_images/me.jpg'):
+            os.makedirs(os.path.join(self.root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.root, name), 'wb') as file:
+                file.write(jpeg('red'))
+        post = self.post_with('legacy', 'posts_images/me.jpg')
+        self.user.userinfo.avatar = 'avatars/me.jpg'
+        self.user.userinfo.save()
+
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('2 files moved into 1 blobs', out.getvalue())
+
+        post.refresh_from_db()
+        self.user.userinfo.refresh_from_db()
+        self.assertTrue(media.is_blob(post.image.name))
+        self.assertEqual(self.user.userinfo.avatar.name, post.image.name)
+        self.assertEqual(post.image_variants['source'], post.image.name)
+        self.assertEqual(models.MediaBlob.objects.get().refs, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'avatars/me.jpg')))
+
+    def test_serve_ranges(self):
+        content = jpeg('red')
+        url = self.post_with('published', SimpleUploadedFile('published.jpg', content)).image.url
+        size = len(content)
+
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(url, headers={'range': 'bytes=2-11'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 2-11/{size}')
+        self.assertEqual(b''.join(response.streaming_content), content[2:12])
+
+        response = self.client.get(url, headers={'range': 'bytes=-5'})
+        self.assertEqual(b''.join(response.streaming_content), content[-5:])
+        self.assertEqual(self.client.get(url, headers={'range': f'bytes={size}-'}).status_code, 416)
+        # a stale If-Range gets the whole new file
+        response = self.client.get(url, headers={'range': 'bytes=0-1', 'if-range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+    def test_variants_built(self):
+        post = self.post_with('variants', SimpleUploadedFile('variants.jpg', jpeg('red')))
+        post.refresh_from_db()
+        manifest = post.image_variants
+        self.assertEqual((manifest['source'], manifest['width'], manifest['height']), (post.image.name, 8, 8))
+        self.assertTrue(manifest['placeholder'].startswith('data:image/jpeg;base64,'))
+        self.assertEqual(set(manifest['sources']), {'webp', 'jpg'})
+        names = list(images.variant_names(manifest))
+        self.assertTrue(all(post.image.storage.exists(name) for name in names))
+
+        post.image = SimpleUploadedFile('variants.jpg', jpeg('blue'))
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants['source'], post.image.name)
+        self.assertFalse(any(post.image.storage.exists(name) for name in names))
+
+    def test_variants_built_in_pool_after_commit(self):
+        submitted = []
+
+        class InlineExecutor:
+            def submit(self, fn, *args):
+                submitted.append(args)
+                future = Future()
+                future.set_result(fn(*args))
+                return future
+
+        executor = images._executor
+        images._executor = InlineExecutor()
+        self.addCleanup(setattr, images, '_executor', executor)
+
+        with override_settings(IMAGE_VARIANT_WORKERS=1), self.captureOnCommitCallbacks(execute=True):
+            post = self.post_with('pooled', SimpleUploadedFile('pooled.jpg', jpeg('red')))
+            # not before the row the callback updates is committed
+            self.assertEqual(submitted, [])
+
+        self.assertEqual(len(submitted), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants['source'], post.image.name)
+        self.assertTrue(all(post.image.storage.exists(name) for name in images.variant_names(post.image_variants)))
+
+    def test_variants_dropped_for_replaced_image(self):
+        post = self.post_with('replaced', SimpleUploadedFile('replaced.jpg', jpeg('red')))
+        stale = post.image
+        rendered = images.render_variants(jpeg('red'))
+        post.image = SimpleUploadedFile('replaced.jpg', jpeg('blue'))
+        post.save()
+
+        # what the pool callback does when the image changed meanwhile
+        manifest = images._store(models.Post, post.pk, 'image', 'image_variants', stale, rendered)
+        self.assertFalse(any(stale.storage.exists(name) for name in images.variant_names(manifest)))
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants['source'], post.image.name)
+
+    def test_draft_media_kept_to_author_and_staff(self):
+        draft = models.Post.objects.create(
+            title='черновик', slug='draft', text='текст', author=self.user, is_published=False,
+            image=SimpleUploadedFile('draft.jpg', jpeg('green')),
+        )
+        # the manifest is stored with update()
+        draft.refresh_from_db()
+        variant = draft.image_variants['sources']['webp'][0][1]
+        for url in (draft.image.url, draft.image.storage.url(variant)):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.client.force_login(self.user)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+            self.client.force_login(self.staff)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.client.logout()
+
+        draft.is_published = True
+        draft.save()
+        self.assertEqual(self.client.get(draft.image.url).status_code, 200)
+
+    @override_settings(MEDIA_OFFLOAD='x-accel-redirect')
+    def test_offload_to_proxy(self):
+        image = self.post_with('offloaded', SimpleUploadedFile('offloaded.jpg', jpeg('red'))).image
+        response = self.client.get(image.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{image.name}')
+        self.assertEqual(response.content, b'')
+
+
+class StubConnection:
+    """What ConnectionPool touches of a psycopg2 connection."""
+    def __init__(self, in_transaction=False, broken=False):
+        self.closed = False
+        self.broken = broken
+        self.pings = 0
+        self.rollbacks = 0
+        self.info = SimpleNamespace(
+            transaction_status=TRANSACTION_STATUS_INTRANS if in_transaction else TRANSACTION_STATUS_IDLE
+        )
+
+    @contextmanager
+    def cursor(self):
+        if self.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+        yield SimpleNamespace(execute=lambda sql: setattr(self, 'pings', self.pings + 1))
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolUnitTest(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+        self.pool = ConnectionPool(max_size=2, timeout=0.01, check_after=30, max_lifetime=3600)
+
+    def connect(self):
+        self.opened.append(StubConnection())
+        return self.opened[-1]
+
+    def age(self, idle_for=0, open_for=0):
+        # moves the pool's clock readings back instead of waiting
+        self.pool.idle = [(conn, returned_at - idle_for) for conn, returned_at in self.pool.idle]
+        self.pool.opened_at = {conn: opened_at - open_for for conn, opened_at in self.pool.opened_at.items()}
+
+    def test_released_connection_is_reused(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(self.connect), first)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(first.pings, 0)
+
+    def test_waits_for_a_free_slot(self):
+        self.pool.acquire(self.connect)
+        second = self.pool.acquire(self.connect)
+        with self.assertRaisesRegex(psycopg2.OperationalError, 'no free database connection'):
+            self.pool.acquire(self.connect)
+
+        self.pool.release(second)
+        self.assertIs(self.pool.acquire(self.connect), second)
+
+    def test_failed_connect_frees_its_slot(self):
+        def refuse():
+            raise psycopg2.OperationalError('connection refused')
+
+        for _ in range(3):
+            with self.assertRaises(psycopg2.OperationalError):
+                self.pool.acquire(refuse)
+        self.pool.acquire(self.connect)
+
+    def test_idle_connection_pinged(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        self.age(idle_for=31)
+        self.assertIs(self.pool.acquire(self.connect), first)
+        self.assertEqual(first.pings, 1)
+
+    def test_dead_idle_connection_replaced(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        first.broken = True
+        self.age(idle_for=31)
+
+        second = self.pool.acquire(self.connect)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+
+    def test_old_connection_recycled(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first)
+        self.age(open_for=3601)
+
+        self.assertIsNot(self.pool.acquire(self.connect), first)
+        self.assertTrue(first.closed)
+        self.assertEqual(first.pings, 0)
+        self.assertNotIn(first, self.pool.opened_at)
+
+    def test_open_transaction_rolled_back_on_release(self):
+        first = self.pool.acquire(self.connect)
+        first.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        self.pool.release(first)
+        self.assertEqual(first.rollbacks, 1)
+        self.assertIs(self.pool.acquire(self.connect), first)
+
+    def test_connection_that_cant_roll_back_dropped(self):
+        first = self.pool.acquire(self.connect)
+        first.info.transaction_status = TRANSACTION_STATUS_INTRANS
+        first.broken = True
+        self.pool.release(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(self.pool.idle, [])
+
+    def test_release_without_reuse(self):
+        # closed inside atomic(), see DatabaseWrapper._close
+        first = self.pool.acquire(self.connect)
+        self.pool.release(first, reuse=False)
+        self.assertTrue(first.closed)
+        self.assertIsNot(self.pool.acquire(self.connect), first)
+
+
+@skipUnless(connection.settings_dict['ENGINE'] == 'general_stuff.db', "runs against the pooled PostgreSQL backend")
+class ConnectionPoolTest(TransactionTestCase):
+    def test_connection_is_reused(self):
+        connection.ensure_connection()
+        first = connection.connection
+        # what request_finished does with CONN_MAX_AGE = 0
+        connection.close()
+        connection.ensure_connection()
+        self.assertIs(connection.connection, first)
+
+
+class StaticPipelineTest(SimpleTestCase):
+    def test_purge_css(self):
+        css = (
+            '@charset "UTF-8";\n/*! license */ .card { color : red ; } .unused-thing, .btn:hover { margin: 0 }'
+            ' @media (min-width: 1px) { .nowhere { top: 0 } } .alert-danger { color: red }'
+        )
+        purged = assets.purge_css(css, {'card', 'btn'})
+        self.assertTrue(purged.startswith('@charset "UTF-8";'))
+        self.assertIn('/*! license */', purged)
+        self.assertIn('.card{color:red}', purged)
+        self.assertIn('.btn:hover{margin:0}', purged)
+        self.assertIn('.alert-danger', purged)
+        self.assertNotIn('unused-thing', purged)
+        self.assertNotIn('@media', purged)
+
+    def test_build_and_serve(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, STORAGES=PIPELINE_STORAGES):
+            call_command('build_static', stdout=StringIO())
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            hashed = staticfiles_storage.stored_name('css/styles.css')
+            self.assertNotEqual(hashed, 'css/styles.css')
+            self.assertTrue(os.path.exists(os.path.join(root, hashed + '.gz')))
+            self.assertLess(
+                os.path.getsize(os.path.join(root, hashed)),
+                os.path.getsize(os.path.join(settings.BASE_DIR, 'static', 'css', 'styles.css')),
+            )
+
+            request = RequestFactory().get('/', headers={'accept-encoding': 'gzip, deflate'})
+            response = serving.static_file(request, hashed)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('Accept-Encoding', response['Vary'])
+            response.close()
+
+            request = RequestFactory().get('/', headers={'if-modified-since': response['Last-Modified']})
+            self.assertEqual(serving.static_file(request, 'css/styles.css').status_code, 304)
+            with self.assertRaises(Http404):
+                serving.static_file(RequestFactory().get('/'), '../manage.py')
+
+
+class AdminTest(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='password')
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        return self.client.get(reverse(f'admin:general_stuff_{model}_changelist'), params)
+
+    def test_changelist_budget(self):
+        for model in ('post', 'comment', 'userinfo'):
+            with self.subTest(model), self.assertQueryBudget(7):
+                self.assertEqual(self.changelist(model).status_code, 200)
+
+        year = self.post.created_at.year
+        with self.assertQueryBudget(5):
+            response = self.changelist('post', created_at__year=year)
+        self.assertEqual(response.context['cl'].result_count, POSTS)
+
+    def test_search_uses_indexed_lookups(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.changelist('post', q=self.user.username)
+        self.assertEqual(
+            {post.author_id for post in response.context['cl'].result_list}, {self.user.pk}
+        )
+        self.assertFalse([query for query in context.captured_queries if ' LIKE ' in query['sql']])
+
+        found = self.changelist('post', q=str(self.post.pk)).context['cl'].result_list
+        self.assertEqual(found[0].pk, self.post.pk)
+        found = self.changelist('post', q='post-5').context['cl'].result_list
+        self.assertEqual({post.slug for post in found}, {'post-5', *(f'post-5{i}' for i in range(10))})
+
+        comments = self.changelist('comment', q=self.user.username).context['cl'].result_list
+        self.assertTrue(comments)
+        self.assertTrue(all(self.user.pk in (comment.author_id, comment.post.author_id) for comment in comments))
+
+    def test_estimated_count(self):
+        paginator = EstimatedCountPaginator(models.Post.objects.filter(is_published=True), 10)
+        paginator.count_limit = 20
+        self.assertEqual(paginator.count, 20)
+
+        # no statistics yet, counted up to the limit
+        paginator = EstimatedCountPaginator(models.Post.objects.all(), 10)
+        paginator.count_limit = 20
+        self.assertEqual(paginator.count, 20)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(models.Post.objects.all(), 10)
+        paginator.count_limit = 20
+        self.assertEqual(paginator.count, POSTS)
@@ -1,4 +1,7 @@
 from django.urls import path
+from . import api
+from . import feeds
+from . import sitemaps
 from . import views
 
 
@@ -8,12 +11,23 @@ urlpatterns = [
     path('users/<username>/', views.UserProfileView.as_view(), name='user-profile'),
     path('users/<username>/update', views.UserProfileUpdateView.as_view(), name='user-profile-update'),
     path('posts/', views.PostListView.as_view(), name='posts'),
+    path('load-more/', views.load_more_posts, name='load-more'),
     path('posts/<slug:slug>/', views.PostDetailView.as_view(), name='post-detail'),
+    path('posts/<slug:slug>/comments/', views.CommentCreateView.as_view(), name='comment-create'),
     path('post-create/', views.PostCreateView.as_view(), name='post-create'),
     path('post-update/<slug:slug>/', views.PostUpdateView.as_view(), name='post-update'),
     path('post-delete/<slug:slug>/confirm/', views.confirm_post_delition, name='post-delete-confirm'),
     path('post-delete/<slug:slug>/<int:confirm>', views.delete_post, name='post-delete'),
     path('tagline/', views.TaglineView.as_view(), name='tagline'),
     path('about/', views.about, name='about'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('feed/rss/', feeds.rss, name='feed-rss'),
+    path('feed/atom/', feeds.atom, name='feed-atom'),
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap'),
+    path('sitemap-<int:section>.xml', sitemaps.sitemap_section, name='sitemap-section'),
+    path('api/posts/', api.post_list, name='api-posts'),
+    path('api/posts/<slug:slug>/', api.post_detail, name='api-post'),
+    path('api/authors/<username>/', api.author_detail, name='api-author'),
+    path('api/tagline/', api.tagline, name='api-tagline'),
     path('', views.HomeView.as_view(), name="home"),
 ]
@@ -1,13 +1,27 @@
-import re
-from uuid import uuid4
 from django.views.generic import DetailView, View, CreateView, UpdateView
 from django.shortcuts import render, redirect, get_object_or_404, reverse
 from django.contrib.auth import logout, login
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.utils.formats import date_format
+from django.utils.timezone import localtime
+from . import comments
 from . import models
 from . import forms
+from . import profiles
+from . import metrics
+from . import search
+from . import slugs
+from .caching import anonymous_page_cache
+from .conditional import conditional_page, home_etag, home_last_modified, post_etag, post_last_modified
+from .pagination import InvalidCursor, KeysetPaginator
+from .templatetags.image_tags import variant_url
 
 # FIRST OF ALL
 #
@@ -21,55 +35,86 @@ AUTHORIZATION_REQUIRED = "Этот контент требует авториз
 FORM_INVALID = "Ошибка в передаваемых данных."
 NO_URL = "Ресурс не существует!"
 
-RUSSIAN_TO_ENGLISH = {
-    "а": "a",
-    "б": "b",
-    "в": "v",
-    "г": "g",
-    "д": "d",
-    "е": "e",
-    "ё": "yo",
-    "ж": "zh",
-    "з": "z",
-    "и": "i",
-    "й": "y",
-    "к": "k",
-    "л": "l",
-    "м": "m",
-    "н": "n",
-    "о": "o",
-    "п": "p",
-    "р": "r",
-    "с": "s",
-    "т": "t",
-    "у": "u",
-    "ф": "f",
-    "х": "x",
-    "ц": "c",
-    "ч": "ch",
-    "ш": "sh",
-    "щ": "shch",
-    "ъ": "",
-    "ы": "y",
-    "ь": "",
-    "э": "e",
-    "ю": "yu",
-    "я": "ya",
-}
-
-
-def generate_slug(title):
-    title = title.lower()
-
-    for russian, english in RUSSIAN_TO_ENGLISH.items():
-        title = title.replace(russian, english)
-    
-    title = '-'.join(title.split())
-    title = re.sub(r'[^\w\-]', '', title)
+SEARCH_PAGE_SIZE = 10
+FEED_PAGE_SIZE = 10
+COMMENTS_PAGE_SIZE = 20
+
+def found_message(count):
+    if count % 10 == 1 and count % 100 != 11:
+        return f"Найден {count} пост!"
+    if count % 10 in (2, 3, 4) and count % 100 not in (12, 13, 14):
+        return f"Найдено {count} поста!"
+    return f"Найдено {count} постов!"
+
+
+def search_results(request, search_term):
+    results = search.search_posts(search_term, published_only=not request.user.is_staff)
+    page_obj = Paginator(results, SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+    found = page_obj.paginator.count
+
+    messages.info(request, found_message(found))
+    if not found:
+        return redirect('/')
+
+    return render(
+        request,
+        'general_stuff/posts.html',
+        {
+            'posts': page_obj,
+            'page_obj': page_obj,
+            'search_term': search_term,
+        }
+    )
+
+
+def feed_page(request, posts, per_page=FEED_PAGE_SIZE):
+    # the lists show excerpts, the body stays in the database
+    paginator = KeysetPaginator(posts.select_related('author').defer('text'), per_page)
+    try:
+        return paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        # stale or hand-made cursor, start over
+        return paginator.get_page()
+
+
+def load_more_posts(request):
+    page = feed_page(request, models.Post.objects.filter(is_published=True))
+
+    next_url = None
+    if page.has_next:
+        next_url = f"{reverse('load-more')}?after={page.next_cursor}"
+
+    return JsonResponse({
+        'results': [
+            {
+                'title': post.title,
+                'url': post.get_absolute_url(),
+                'author': post.author.username,
+                'author_url': reverse('user-profile', kwargs={'username': post.author.username}),
+                'created_at': post.created_at.isoformat(),
+                'created_at_display': date_format(localtime(post.created_at), "F j, Y"),
+                'image': variant_url(post.image, post.image_variants, 960) if post.image else None,
+                'text': post.excerpt,
+            }
+            for post in page
+        ],
+        'next_cursor': page.next_cursor,
+        'next': next_url,
+    })
+
+
+def has_metrics_token(request):
+    # behind the proxy every request comes from its address, so the
+    # scraper proves itself with a token rather than where it connects from
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
 
-    if models.Post.objects.filter(slug=title).exists():
-        title += '-' + str(uuid4())
-    return title
+def metrics_view(request):
+    # scraped by Prometheus, staff can look at it too
+    if not has_metrics_token(request) and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def logout_user(request):
@@ -87,7 +132,7 @@ def about(request):
 
 def confirm_post_delition(request, slug):
     try:
-        post = get_object_or_404(models.Post, slug=slug)
+        post = get_object_or_404(models.Post.objects.select_related('author').defer('text'), slug=slug)
         return render(request, 'general_stuff/confirm_post_delition.html', {'post': post})
     except Exception:
         messages.warning(request, NO_URL)
@@ -117,52 +162,50 @@ def delete_post(request, slug, confirm):
 
 # Views
 class HomeView(View):
+    @method_decorator(conditional_page(home_etag, home_last_modified))
+    @method_decorator(anonymous_page_cache)
     def get(self, request, **kwargs):
         search_term = request.GET.get('q')
 
         if search_term:
-            query = Q(title__icontains=search_term) | Q(text__icontains=search_term)
-            posts = models.Post.objects.filter(query)
-
-            end_is_one = str(len(posts))[-1] == '1'
-            end_is_lesser_five = str(len(posts))[-1] in ('2', '3' ,'4')
-
-            if end_is_one:
-                messages.info(request, f"Найден {len(posts)} пост!")
-            elif end_is_lesser_five:
-                messages.info(request, f"Найдено {len(posts)} поста!")
-            else:
-                messages.info(request, f"Найдено {len(posts)} постов!")
-
-                if str(len(posts)) == '0':
-                    return redirect('/')
-
-            return render(request, 'general_stuff/posts.html', {'posts': posts, 'search_term': search_term})
+            return search_results(request, search_term)
 
         # case just home view
+        page = feed_page(request, models.Post.objects.filter(is_published=True))
         return render(
             request,
             "general_stuff/index.html",
             {
-                'posts': models.Post.objects.filter(is_published=True),
-                'tagline': models.Tagline.objects.all()[0],
-                'dreamteam': models.UserInfo.objects.filter(dream_team=True),
+                'posts': page.object_list,
+                'page': page,
             }
         )
 
 
 class PostDetailView(DetailView):
+    @method_decorator(conditional_page(post_etag, post_last_modified))
     def get(self, request, slug):
         if request.user.is_authenticated:
-            post = models.Post.objects.get(slug=slug)
+            # the stored HTML is shown, the text is only loaded for a post not rendered yet
+            post = get_object_or_404(models.Post.objects.select_related('author').defer('text'), slug=slug)
+            paginator = KeysetPaginator(
+                post.comment_set.select_related('author'),
+                COMMENTS_PAGE_SIZE,
+                ordering=('created_at', 'id'),
+            )
+            try:
+                comments_page = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+            except InvalidCursor:
+                comments_page = paginator.get_page()
+
             return render(
                 request,
                 "general_stuff/post_detail.html",
                 {
                     'title': slug,
                     'post': post,
-                    'tagline': models.Tagline.objects.all()[0],
-                    'dreamteam': models.UserInfo.objects.filter(dream_team=True),
+                    'comments': comments_page,
+                    'comment_form': forms.CommentForm(),
                 }
             )
         
@@ -171,6 +214,28 @@ class PostDetailView(DetailView):
         return redirect('/login')
 
 
+class CommentCreateView(View):
+    form_class = forms.CommentForm
+
+    def post(self, request, slug):
+        if request.user.is_authenticated:
+            post = get_object_or_404(models.Post, slug=slug)
+            form = self.form_class(request.POST)
+
+            if form.is_valid():
+                comments.add_comment(post, request.user, form.cleaned_data['text'])
+                messages.success(request, 'Комментарий добавлен.')
+                return redirect(post.get_absolute_url() + '#comments')
+
+            # case form invalid
+            messages.warning(request, FORM_INVALID)
+            return redirect(post.get_absolute_url() + '#comments')
+
+        # case unauthorized
+        messages.warning(request, AUTHORIZATION_REQUIRED)
+        return redirect('/login')
+
+
 class PostCreateView(CreateView):
     form_class = forms.PostCreateForm
 
@@ -194,11 +259,10 @@ class PostCreateView(CreateView):
                 image = form.cleaned_data['image']
                 is_published = form.cleaned_data['is_published']
                 author = request.user
-                slug = generate_slug(title)
 
-                # create an instance of post
-                models.Post.objects.create(
-                    title=title[:49], text=text, image=image, is_published=is_published, author=author, slug=slug
+                # create an instance of post, the slug is picked from the title
+                slugs.create_post(
+                    title=title[:49], text=text, image=image, is_published=is_published, author=author
                 )
                 
                 messages.success(request, 'Пост успешно создан!')
@@ -251,14 +315,13 @@ class PostUpdateView(UpdateView):
 class PostListView(View):
     def get(self, request):
         if request.user.is_staff:
-            posts = models.Post.objects.all()
+            page = feed_page(request, models.Post.objects.all())
             return render(
                 request,
                 "general_stuff/posts.html",
                 {
-                    "posts": posts,
-                    'tagline': models.Tagline.objects.all()[0],
-                    'dreamteam': models.UserInfo.objects.filter(dream_team=True),
+                    "posts": page.object_list,
+                    "page": page,
                 }
             )
 
@@ -270,17 +333,19 @@ class PostListView(View):
 class UserProfileView(View):
     def get(self, request, username):
         if request.user.is_authenticated:
+            # the user with the profile, a page of posts, the cards cached
+            main_data = get_object_or_404(User.objects.select_related('userinfo'), username=username)
+            page = feed_page(request, profiles.author_posts(main_data), per_page=profiles.PROFILE_PAGE_SIZE)
 
-            main_data = get_object_or_404(User, username=username)
-            rest_data = main_data.userinfo
-            
             return render(
                 request,
                 "general_stuff/user_profile.html",
                 {
                     "title": username,
                     "main_data": main_data,
-                    "rest_data": rest_data
+                    "profile_block": profiles.profile_block(main_data, request.user.pk == main_data.pk),
+                    "posts": page.object_list,
+                    "page": page,
                 }
             )
         
@@ -376,7 +441,7 @@ class TaglineView(View):
 class UserProfileUpdateView(View):
     def get(self, request, username):
         if request.user.username == username:
-            user = get_object_or_404(User, username=username)
+            user = get_object_or_404(User.objects.select_related('userinfo'), username=username)
             
             user_form = forms.UserUpdateForm(instance=user)
             userinfo_form = forms.UserInfoUpdateForm(instance=user.userinfo)
@@ -393,7 +458,7 @@ class UserProfileUpdateView(View):
 
     def post(self, request, username):
         if request.user.is_authenticated:
-            user = get_object_or_404(User, username=username)
+            user = get_object_or_404(User.objects.select_related('userinfo'), username=username)
             user_form = forms.UserUpdateForm(request.POST, instance=user)
             userinfo_form = forms.UserInfoUpdateForm(request.POST, instance=user.userinfo)
             
@@ -7,6 +7,9 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'website.settings')
+    if sys.argv[1:2] == ['test']:
+        # SQLite, so the suite runs without a database server
+        os.environ.setdefault('DJANGO_PROFILE', 'test')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -4,4 +4,66 @@
 * Licensed under MIT (https://github.com/StartBootstrap/startbootstrap-blog-post/blob/master/LICENSE)
 */
 // This file is intentionally blank
-// Use this file to add JavaScript to your project
\ No newline at end of file
+// Use this file to add JavaScript to your project
+// Infinite scroll for the home feed: the "next" link of the keyset
+// pagination carries a data-load-more url of the JSON endpoint.
+(function () {
+    const template = document.getElementById('post-card');
+    const link = document.querySelector('[data-load-more]');
+    if (!template || !link || !('IntersectionObserver' in window)) {
+        return;
+    }
+
+    const nav = link.closest('nav');
+    let loading = false;
+
+    function renderCard(post) {
+        const card = template.content.firstElementChild.cloneNode(true);
+        card.querySelector('[data-field="title"]').textContent = post.title;
+        card.querySelector('[data-field="created_at_display"]').textContent = post.created_at_display;
+        card.querySelector('[data-field="text"]').textContent = post.text;
+
+        const author = card.querySelector('[data-field="author"]');
+        author.textContent = post.author;
+        author.href = post.author_url;
+        card.querySelector('[data-field="url"]').href = post.url;
+
+        if (post.image) {
+            const figure = card.querySelector('figure');
+            figure.querySelector('img').src = post.image;
+            figure.hidden = false;
+        }
+        return card;
+    }
+
+    function loadMore() {
+        const url = link.dataset.loadMore;
+        if (loading || !url) {
+            return;
+        }
+        loading = true;
+
+        fetch(url, { headers: { 'Accept': 'application/json' } })
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                data.results.forEach(function (post) {
+                    nav.parentNode.insertBefore(renderCard(post), nav);
+                });
+                if (data.next) {
+                    link.dataset.loadMore = data.next;
+                    link.href = '?after=' + data.next_cursor;
+                } else {
+                    observer.disconnect();
+                    nav.remove();
+                }
+            })
+            .finally(function () { loading = false; });
+    }
+
+    const observer = new IntersectionObserver(function (entries) {
+        if (entries.some(function (entry) { return entry.isIntersecting; })) {
+            loadMore();
+        }
+    }, { rootMargin: '400px' });
+    observer.observe(nav);
+})();
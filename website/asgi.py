@@ -9,8 +9,20 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'website.settings')
 
-application = get_asgi_application()
+# the read views have async versions, WSGI keeps using website.urls
+ASYNC_URLCONF = 'website.urls_async'
+
+
+class AsyncReadPathHandler(ASGIHandler):
+    async def get_response_async(self, request):
+        request.urlconf = ASYNC_URLCONF
+        return await super().get_response_async(request)
+
+
+django.setup(set_prefix=False)
+application = AsyncReadPathHandler()
@@ -0,0 +1,22 @@
+"""
+Settings profiles of the website project. base holds what every
+environment shares, the profile named by DJANGO_PROFILE adjusts it:
+
+    dev   runserver against the database from .env, DEBUG on (default)
+    test  SQLite and fast hashing, `manage.py test` picks it by itself
+    prod  DEBUG off, secret key and hosts required from the environment
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+PROFILE = os.environ.get('DJANGO_PROFILE', 'dev')
+
+if PROFILE == 'dev':
+    from .dev import *  # noqa: F401,F403
+elif PROFILE == 'test':
+    from .test import *  # noqa: F401,F403
+elif PROFILE == 'prod':
+    from .prod import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(f"DJANGO_PROFILE must be dev, test or prod, not {PROFILE!r}")
@@ -0,0 +1,256 @@
+"""
+Django settings shared by every profile of the website project, see
+website/settings/__init__.py for how a profile is picked.
+
+Generated by 'django-admin startproject' using Django 5.0.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.0/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.0/ref/settings/
+"""
+
+from pathlib import Path
+import os
+from dotenv import dotenv_values
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Environment variables: .env next to manage.py, overridden by real ones
+# prefixed with DJANGO_ (a bare USER would be the shell's)
+config = dotenv_values(BASE_DIR / '.env')
+
+
+def env(name, default=None):
+    return os.environ.get(f'DJANGO_{name}', config.get(name, default))
+
+
+def env_list(name, default=''):
+    return [item.strip() for item in env(name, default).split(',') if item.strip()]
+
+
+# See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = env('SECRET_KEY')
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = env_list('ALLOWED_HOSTS')
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django.contrib.postgres',
+    # my apps
+    'general_stuff',
+    # exeternal
+    'crispy_forms',
+    'crispy_bootstrap5',
+    'phonenumber_field',
+]
+
+CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
+
+CRISPY_TEMPLATE_PACK = "bootstrap5"
+
+MIDDLEWARE = [
+    # first, so its timings cover the rest of the stack
+    'general_stuff.middleware.PerformanceMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'website.urls'
+
+TEMPLATES = [
+    {
+        # DjangoTemplates that reports render time to PerformanceMiddleware
+        'BACKEND': 'general_stuff.metrics.TimedDjangoTemplates',
+        'DIRS': ['templates'],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'general_stuff.context_processors.sidebar',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'website.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+
+# Connections per worker process: match the worker's threads, and keep
+# workers * DB_POOL_SIZE below the server's max_connections
+DB_POOL_SIZE = int(env('DB_POOL_SIZE', 4))
+
+DATABASES = {
+    'default': {
+        # PostgreSQL with a per-process connection pool, see general_stuff/db
+        'ENGINE': 'general_stuff.db',
+        'NAME': env('NAME'),
+        'USER': env('USER'),
+        'PASSWORD': env('PASSWORD'),
+        'HOST': env('HOST', ''),
+        'PORT': env('PORT', ''),
+        # closing at the end of a request hands the connection back to the pool
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': DB_POOL_SIZE,
+            'TIMEOUT': int(env('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+}
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+# The user of each request, with its profile, comes from the cache. Logins
+# go through the cached backend; ModelBackend stays for the sessions signed
+# in before it, Django only loads a session's user through the backend
+# stored in it.
+AUTHENTICATION_BACKENDS = [
+    'general_stuff.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Sessions are read from the cache, the database only keeps them across
+# cache restarts
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Sessions, cached users, the page version and everything keyed by it are
+# only correct when every worker process reads the same cache: a logout or
+# a bump in one worker has to reach the others. CACHE_URL is a redis://
+# URL; without it each process keeps its own cache, fine for a single
+# runserver and the tests, refused by the prod profile
+CACHE_URL = env('CACHE_URL', '')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'website',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.0/topics/i18n/
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.0/howto/static-files/
+
+STATIC_URL = 'static/'
+
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
+
+STORAGES = {
+    # uploads are stored once per content, see general_stuff.media
+    'default': {
+        'BACKEND': 'general_stuff.media.ContentAddressedStorage',
+    },
+    # `manage.py build_static` fills STATIC_ROOT with purged, hashed and
+    # precompressed files, the hashed names only exist after a build
+    'staticfiles': {
+        'BACKEND': 'general_stuff.assets.PrecompressedManifestStaticFilesStorage',
+    },
+}
+
+# Stylesheets stripped of the rules no template uses, and class patterns
+# to keep on top of the ones in general_stuff.assets.DEFAULT_SAFELIST
+STATIC_PURGE = ['css/styles.css']
+STATIC_PURGE_SAFELIST = []
+
+# Absolute filesystem path to the directory where uploaded media files will be stored
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# URL that handles the media served from MEDIA_ROOT
+MEDIA_URL = '/media/'
+
+# general_stuff.serving.media_file checks who may read a file, then by
+# default sends it itself. 'x-accel-redirect' hands it to nginx, with
+#     location /protected-media/ { internal; alias /path/to/media/; }
+# 'x-sendfile' to Apache's mod_xsendfile or lighttpd, by absolute path
+MEDIA_OFFLOAD = env('MEDIA_OFFLOAD', '')
+MEDIA_ACCEL_PREFIX = env('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Processes that render resized copies of uploaded images,
+# 0 renders them synchronously in the request
+IMAGE_VARIANT_WORKERS = 2
+
+# Bearer token that reads /metrics without logging in, for the Prometheus
+# server (authorization: {credentials: ...} in its scrape config); empty
+# leaves /metrics to staff
+METRICS_TOKEN = env('METRICS_TOKEN', '')
+
+# Send the Server-Timing header to every client, not only to staff;
+# DEBUG does the same
+SERVER_TIMING_PUBLIC = False
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+LOGIN_REDIRECT_URL = '/'
+LOGOUT_REDIRET_URL = '/login'
@@ -0,0 +1,13 @@
+from .base import *  # noqa: F401,F403
+
+DEBUG = True
+
+SECRET_KEY = env('SECRET_KEY', 'django-insecure-dev-only')
+
+STORAGES = {
+    **STORAGES,
+    # files straight from static/, no build_static needed
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
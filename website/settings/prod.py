@@ -0,0 +1,15 @@
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+
+DEBUG = False
+
+missing = [name for name in ('SECRET_KEY', 'ALLOWED_HOSTS', 'NAME', 'USER') if not env(name)]
+if missing:
+    raise ImproperlyConfigured(f"{', '.join(missing)} must be set in .env or as DJANGO_ variables in production")
+
+if CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+    raise ImproperlyConfigured(
+        "CACHE_URL must point at a cache shared by the workers in production, a per-process cache keeps "
+        "logged out users and stale pages on every worker but the one that saw the change"
+    )
@@ -0,0 +1,22 @@
+from .base import *  # noqa: F401,F403
+
+SECRET_KEY = 'django-insecure-test-only'
+
+# the test runner swaps this for an in-memory SQLite database; the file is
+# only created when other commands (migrate, shell) run with this profile
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    }
+}
+
+# tests create users by the hundred, the real hasher is slow on purpose
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
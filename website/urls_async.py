@@ -0,0 +1,17 @@
+"""
+URL configuration for the ASGI entry point, see website/asgi.py.
+
+The read views come in their async form from general_stuff.async_views,
+under the same names, so reverse() gives the same URLs. Everything else
+falls through to website.urls.
+"""
+from django.urls import include, path
+from general_stuff import async_views
+
+urlpatterns = [
+    path('', async_views.home, name='home'),
+    path('posts/', async_views.post_list, name='posts'),
+    path('posts/<slug:slug>/', async_views.post_detail, name='post-detail'),
+    path('users/<username>/', async_views.user_profile, name='user-profile'),
+    path('', include('website.urls')),
+]